@@ -1,13 +1,26 @@
-from app.core.llm import llm
+from app.core.llm import get_llm
 from app.tools.python_tool import python_expert
 from app.tools.rag_tool import rag_search
 from app.tools.api_tool import api_agent
 from app.tools.misc_tools import joke_generator, current_time, solve_math
+from app.tools.cache import get_tool_cache
+from app.agents.router import try_fast_path
 from app.helper.memory_function import MemoryFunction
-from app.helper.guardrails import input_guardrail_check, output_guardrail_check
-
-from langchain.tools import tool
+from app.helper.guardrails import ainput_guardrail_check, aoutput_guardrail_check
+from app.helper.token_budget import TokenBudget
+from app.helper.semantic_cache import get_semantic_cache, uses_personal_context
+from app.core.telemetry import AGENT_REQUESTS, AGENT_STEPS, LLM_TOKENS, TOOL_SECONDS, mark_failed, stage
+
+from langchain_core.tools import tool
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+import os
+import re
+import time
+import asyncio
 import json
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 @tool
@@ -45,123 +58,368 @@ Observation: the result from the tool (this will be provided to you).
 ... (repeat Thought/Action/Action Input/Observation if needed)
 Final Answer: your final response to the user based on tool observations.
 
+When several tool calls don't depend on each other (e.g. fetching a few endpoints you already know),
+write one Action/Action Input pair per call in the same step. They run in parallel and
+their results come back together as numbered observations, in the same order.
+
 Available tools:
 {tools_desc}
 """
 
+# Built once: the rules and tool catalog form a byte-identical prefix on every call,
+# which lets the provider's prompt cache reuse it across steps and requests.
+TOOLS_LIST = ", ".join(TOOLS.keys())
+TOOLS_DESC = "\n".join([f"- {name}: {tool.description}" for name, tool in TOOLS.items()])
+SYSTEM_PROMPT = BASE_PROMPT.format(tools=TOOLS_LIST, tools_desc=TOOLS_DESC).strip()
+
+
+REFUSAL = "I can’t help with harmful content."
+CONTENT_FILTER_MESSAGE = "I encountered a content filter error. This usually happens when processing sensitive data like phone numbers. I've noted your information and will proceed carefully."
+MAX_STEPS_MESSAGE = "I'm sorry, I couldn't complete the task within the maximum number of steps. Please try again or rephrase your request."
+FINAL_MARKER = "Final Answer:"
+# Streamed answer text is released a sentence at a time, once the output guardrail has passed it
+SENTENCE_END = re.compile(r"[.!?]\s+|\n")
+EVENT_PREVIEW_CHARS = 1000
+
+# Parallel actions per step, and how long each tool may run before it counts as failed
+MAX_PARALLEL_ACTIONS = int(os.getenv("MAX_PARALLEL_ACTIONS", "5"))
+DEFAULT_TOOL_TIMEOUT = float(os.getenv("DEFAULT_TOOL_TIMEOUT", "30"))
+TOOL_TIMEOUTS = {
+    "rag_search": 15,
+    "api_agent": 20,
+    "python_expert": 60,
+    "current_time": 2,
+    "solve_math": 2,
+}
+
 
-def run_agent(inputs, max_steps=10, verbose=True):
+def _needs_data_retry(question: str, observed: bool) -> bool:
+    return ("comment" in question.lower() or "post" in question.lower()) and not observed
+
+
+def _usage_event(step: int, usage: dict | None) -> dict:
+    usage = usage or {}
+    return {
+        "type": "usage",
+        "step": step,
+        "prompt_tokens": usage.get("input_tokens"),
+        "cached_tokens": (usage.get("input_token_details") or {}).get("cache_read"),
+        "completion_tokens": usage.get("output_tokens"),
+    }
+
+
+def _sentence_end(text: str, start: int) -> int:
+    """End of the last complete sentence in text[start:], or 0 if there is none yet."""
+    end = 0
+    for match in SENTENCE_END.finditer(text, start):
+        end = match.end()
+    return end
+
+
+def _parse_output(output: str) -> dict:
+    """Thought plus every Action/Action Input pair in the output, in order."""
+    parsed = {"Thought": "", "actions": []}
+    current = None
+    for line in output.splitlines():
+        line = line.strip()
+        if line.startswith("Thought:"):
+            parsed["Thought"] = line.replace("Thought:", "", 1).strip()
+            current = (parsed, "Thought")
+        elif line.startswith("Action Input:"):
+            if not parsed["actions"]:
+                parsed["actions"].append({"Action": "", "Action Input": ""})
+            parsed["actions"][-1]["Action Input"] = line.replace("Action Input:", "", 1).strip()
+            current = (parsed["actions"][-1], "Action Input")
+        elif line.startswith("Action:"):
+            parsed["actions"].append({"Action": line.replace("Action:", "", 1).strip(), "Action Input": ""})
+            current = (parsed["actions"][-1], "Action")
+        elif current:
+            target, key = current
+            target[key] += " " + line
+    return parsed
+
+
+async def _execute_tool(action: str, action_input: str, memory: MemoryFunction) -> str:
+    if action == "save_user_profile":
+        try:
+            info = json.loads(action_input) if isinstance(action_input, str) and (action_input.startswith("{") or action_input.startswith("[")) else {"info": action_input}
+        except:
+            info = {"info": action_input}
+        await asyncio.to_thread(memory.update_profile, info)
+        return f"Successfully saved user info: {info}"
+
+    try:
+        if action == "api_agent" and isinstance(action_input, str) and not action_input.startswith("{"):
+            actual_input = {"endpoint": action_input}
+        else:
+            actual_input = json.loads(action_input)
+    except:
+        actual_input = action_input
+
+    return await get_tool_cache().arun(action, TOOLS[action], actual_input)
+
+
+async def _run_action(index: int, action: str, action_input: str, memory: MemoryFunction, parent=None):
+    """Run one tool call with its timeout; never raises, so one failure can't sink its siblings."""
+    if action not in TOOLS:
+        return index, f"Unknown tool '{action}'. Please use one of: {TOOLS_LIST}", True
+    timeout = TOOL_TIMEOUTS.get(action, DEFAULT_TOOL_TIMEOUT)
+    start = time.perf_counter()
+    with stage("tool", parent=parent, tool=action, input_chars=len(action_input)) as span:
+        try:
+            result = await asyncio.wait_for(_execute_tool(action, action_input, memory), timeout=timeout)
+            result, failed = str(result), False
+        except asyncio.TimeoutError:
+            result, failed = f"Tool error - {action} timed out after {timeout}s", True
+            mark_failed(span, "tool", "TimeoutError")
+        except Exception as e:
+            result, failed = f"Tool error - {str(e)}", True
+            mark_failed(span, "tool", type(e).__name__)
+        span.set_attribute("output_chars", len(result))
+    TOOL_SECONDS.observe(time.perf_counter() - start, tool=action)
+    return index, result, failed
+
+
+def _outcome(event: dict) -> str:
+    if event.get("routed"):
+        return "routed"
+    if event.get("cached"):
+        return "cached"
+    return {
+        REFUSAL: "refused",
+        CONTENT_FILTER_MESSAGE: "content_filter",
+        MAX_STEPS_MESSAGE: "max_steps",
+    }.get(event["output"], "answered")
+
+
+async def astream_agent(inputs, max_steps=10, verbose=True):
+    """
+    Run the ReAct loop without blocking the event loop.
+    Yields events as they happen:
+    - thought / tool_start / tool_end for intermediate steps
+    - usage with the prompt/cached/completion token counts of each LLM call
+    - token for each sentence of the Final Answer once it has passed the output guardrail
+    - final (always last) with the guarded answer and session_id
+    """
+    steps = 0
+    outcome = "error"
+    try:
+        with stage("agent_run", session_id=inputs.get("session_id"), question_chars=len(inputs["input"])) as run_span:
+            async for event in _agent_events(inputs, max_steps, verbose, run_span):
+                if event["type"] == "usage":
+                    steps += 1
+                elif event["type"] == "final":
+                    outcome = _outcome(event)
+                    run_span.set_attribute("outcome", outcome)
+                yield event
+    finally:
+        AGENT_REQUESTS.inc(outcome=outcome)
+        if steps:
+            AGENT_STEPS.observe(steps)
+
+
+async def _agent_events(inputs, max_steps, verbose, run_span):
     question = inputs["input"]
     session_id = inputs.get("session_id", "default")
     user_id = inputs.get("user_id", "default_user")
 
+    # Fast path: time, arithmetic and jokes need a tool, not reasoning. Their inputs are
+    # matched exactly by the router, so they skip the input guardrail; only the joke text
+    # (external content) is checked on the way out.
+    with stage("router", parent=run_span):
+        fast = await try_fast_path(question)
+    if fast:
+        answer = fast["output"]
+        if fast["intent"] == "joke":
+            with stage("guardrail_output", parent=run_span, chars=len(answer)):
+                answer, output_valid, _ = await aoutput_guardrail_check(question, answer)
+            answer = answer if output_valid else REFUSAL
+        memory = MemoryFunction(session_id, user_id)
+        with stage("mongo_write", parent=run_span, messages=2):
+            await asyncio.to_thread(memory.add_messages, [("user", question), ("assistant", answer)])
+        yield {"type": "final", "output": answer, "session_id": session_id, "streamed": False, "routed": fast["intent"]}
+        return
+
     # Guardrail Check
-    sanitized_question, input_valid, input_risk = input_guardrail_check(question)
+    with stage("guardrail_input", parent=run_span, chars=len(question)):
+        sanitized_question, input_valid, input_risk = await ainput_guardrail_check(question)
     if not input_valid:
-        return {"output": "I can’t help with harmful content.", "session_id": session_id}
+        yield {"type": "final", "output": REFUSAL, "session_id": session_id, "streamed": False}
+        return
     question = sanitized_question
 
     memory = MemoryFunction(session_id, user_id)
-    history = memory.get_full_context()
-
-    scratchpad = ""
 
-    tools_desc = "\n".join([f"- {name}: {tool.description}" for name, tool in TOOLS.items()])
-    tools_list = ", ".join(TOOLS.keys())
+    # Near-identical questions answered before skip the whole agent loop
+    semantic_cache = get_semantic_cache()
+    if semantic_cache:
+        with stage("semantic_cache_lookup", parent=run_span) as span:
+            cached_answer = await asyncio.to_thread(semantic_cache.lookup, question, user_id)
+            span.set_attribute("hit", cached_answer is not None)
+        if cached_answer:
+            with stage("mongo_write", parent=run_span, messages=2):
+                await asyncio.to_thread(memory.add_messages, [("user", question), ("assistant", cached_answer)])
+            yield {"type": "final", "output": cached_answer, "session_id": session_id, "streamed": False, "cached": True}
+            return
+
+    budget = TokenBudget()
+    with stage("context", parent=run_span) as span:
+        history = await asyncio.to_thread(memory.get_full_context, budget)
+        span.set_attribute("history_chars", len(history))
+
+    # The scratchpad is a growing list of messages after a fixed prefix, never a rebuilt string
+    messages = [
+        SystemMessage(content=SYSTEM_PROMPT),
+        HumanMessage(content=f"Chat History:\n{history}\n\nUser Question:\n{question}"),
+    ]
+    observed = False
+    tools_used = set()
 
     for step in range(max_steps):
-        prompt = f"""
-{BASE_PROMPT.format(tools=tools_list, tools_desc=tools_desc)}
-
-Chat History:
-{history}
-
-User Question:
-{question}
-
-{scratchpad}
-"""
-
-        try:
-            response = llm.invoke(prompt)
-            output = response.content.strip()
-        except Exception as e:
-            if "content_filter" in str(e).lower():
-                return {
-                    "output": "I encountered a content filter error. This usually happens when processing sensitive data like phone numbers. I've noted your information and will proceed carefully.",
-                    "session_id": session_id
-                }
-            raise e
+        # An answer given before any observation on a data question is discarded, so don't stream it
+        stream_answer = not _needs_data_retry(question, observed)
+        output = ""
+        streamed = ""
+        blocked = False
+        usage = None
+
+        with stage("llm_step", parent=run_span, step=step, messages=len(messages)) as span:
+            try:
+                async for chunk in get_llm().astream(messages):
+                    output += chunk.content
+                    if chunk.usage_metadata:
+                        usage = chunk.usage_metadata
+                    if stream_answer and not blocked and FINAL_MARKER in output:
+                        answer = output.split(FINAL_MARKER)[-1].lstrip()
+                        end = _sentence_end(answer, len(streamed))
+                        if end:
+                            # Nothing reaches the client before the guardrail has seen it
+                            sentences = answer[len(streamed):end]
+                            with stage("guardrail_output", parent=run_span, chars=len(sentences)):
+                                _, sentences_valid, _ = await aoutput_guardrail_check(question, sentences)
+                            if sentences_valid:
+                                yield {"type": "token", "content": sentences}
+                                streamed = answer[:end]
+                            else:
+                                blocked = True
+            except Exception as e:
+                if "content_filter" in str(e).lower():
+                    mark_failed(span, "llm_step", "content_filter")
+                    yield {"type": "final", "output": CONTENT_FILTER_MESSAGE, "session_id": session_id, "streamed": False}
+                    return
+                raise e
+
+            usage_event = _usage_event(step, usage)
+            span.set_attribute("output_chars", len(output))
+            for kind in ("prompt_tokens", "cached_tokens", "completion_tokens"):
+                if usage_event[kind] is not None:
+                    span.set_attribute(kind, usage_event[kind])
+                    LLM_TOKENS.inc(usage_event[kind], kind=kind.removesuffix("_tokens"))
+
+        output = output.strip()
+        messages.append(AIMessage(content=output))
+
+        logger.info(
+            "Agent step %d: prompt_tokens=%s cached_tokens=%s completion_tokens=%s",
+            step, usage_event["prompt_tokens"], usage_event["cached_tokens"], usage_event["completion_tokens"],
+        )
+        yield usage_event
 
         if verbose:
-            print(f"\n-------- Agent working --------\n{output}")
+            logger.debug("Agent step %d output:\n%s", step, output)
+
+        if FINAL_MARKER in output:
+            final_answer = output.split(FINAL_MARKER)[-1].strip()
 
-        if "Final Answer:" in output:
-            final_answer = output.split("Final Answer:")[-1].strip()
-            
-            if ("comment" in question.lower() or "post" in question.lower()) and "Observation:" not in scratchpad:
-                scratchpad += "\nThought: I should have used a tool to fetch real data instead of just providing a final answer. I will now use rag_search to find the correct API endpoint.\n"
+            if not stream_answer:
+                messages.append(AIMessage(content="Thought: I should have used a tool to fetch real data instead of just providing a final answer. I will now use rag_search to find the correct API endpoint."))
                 continue
 
-            # Guardrail Check
-            sanitized_answer, output_valid, output_risk = output_guardrail_check(question, final_answer)
-            final_answer = sanitized_answer if output_valid else "I can’t help with harmful content."
-
-            memory.add_message("user", question)
-            memory.add_message("assistant", final_answer)
-            return {"output": final_answer, "session_id": session_id}
-
-        lines = {k: "" for k in ["Thought", "Action", "Action Input"]}
-        current_key = None
-        for line in output.splitlines():
-            line = line.strip()
-            for key in lines:
-                if line.startswith(f"{key}:"):
-                    lines[key] = line.replace(f"{key}:", "").strip()
-                    current_key = key
-                    break
-            else:
-                if current_key:
-                    lines[current_key] += " " + line
-
-        action = lines["Action"]
-        action_input = lines["Action Input"]
-
-        if action == "NONE" or not action:
-            scratchpad += f"\n{output}\nObservation: No action taken. If you need data, please use a tool.\n"
+            # Guardrail Check (sentences already streamed are verdict-cache hits)
+            with stage("guardrail_output", parent=run_span, chars=len(final_answer)):
+                sanitized_answer, output_valid, output_risk = await aoutput_guardrail_check(question, final_answer)
+            output_valid = output_valid and not blocked
+            final_answer = sanitized_answer if output_valid else REFUSAL
+            if output_valid and final_answer.startswith(streamed) and len(final_answer) > len(streamed):
+                # The last sentence has no terminator to release it during the stream
+                yield {"type": "token", "content": final_answer[len(streamed):]}
+                streamed = final_answer
+
+            with stage("mongo_write", parent=run_span, messages=2):
+                await asyncio.to_thread(memory.add_messages, [("user", question), ("assistant", final_answer)])
+            if semantic_cache and output_valid:
+                personal = uses_personal_context(question, memory.has_context, tools_used)
+                await asyncio.to_thread(semantic_cache.store, question, user_id, final_answer, personal, tools_used)
+            logger.info("Agent run for session %s: token budget saved %d prompt tokens", session_id, budget.saved)
+            yield {
+                "type": "final",
+                "output": final_answer,
+                "session_id": session_id,
+                "streamed": output_valid and final_answer == streamed,
+                "tokens_saved": budget.saved,
+            }
+            return
+
+        parsed = _parse_output(output)
+        requested = [a for a in parsed["actions"] if a["Action"] and a["Action"] != "NONE"]
+        actions, skipped = requested[:MAX_PARALLEL_ACTIONS], requested[MAX_PARALLEL_ACTIONS:]
+
+        if parsed["Thought"]:
+            yield {"type": "thought", "step": step, "content": parsed["Thought"]}
+
+        if not actions:
+            messages.append(HumanMessage(content="Observation: No action taken. If you need data, please use a tool."))
+            observed = True
             continue
 
-        if action not in TOOLS:
-            scratchpad += f"\n{output}\nObservation: Unknown tool '{action}'. Please use one of: {tools_list}\n"
-            continue
+        tools_used.update(a["Action"] for a in actions)
+        for i, a in enumerate(actions):
+            yield {"type": "tool_start", "step": step, "index": i, "tool": a["Action"], "input": a["Action Input"]}
+
+        # Independent calls run concurrently; events are emitted as each one finishes
+        results = [None] * len(actions)
+        tasks = [_run_action(i, a["Action"], a["Action Input"], memory, run_span) for i, a in enumerate(actions)]
+        for next_done in asyncio.as_completed(tasks):
+            i, result, failed = await next_done
+            results[i] = result
+            event = {"type": "tool_end", "step": step, "index": i, "tool": actions[i]["Action"]}
+            event.update({"error": result} if failed else {"output": result[:EVENT_PREVIEW_CHARS]})
+            yield event
+
+        observations = [await asyncio.to_thread(budget.fit_observation, result) for result in results]
+        if len(actions) == 1:
+            content = f"Observation: {observations[0]}"
+        else:
+            content = "\n\n".join(
+                f"Observation [{i + 1}] ({a['Action']}): {observation}"
+                for i, (a, observation) in enumerate(zip(actions, observations))
+            )
+        if skipped:
+            # Tell the model, or it would treat them as done
+            content += (
+                f"\n\nNot run (at most {MAX_PARALLEL_ACTIONS} actions per step): "
+                + "; ".join(f"{a['Action']}({a['Action Input']})" for a in skipped)
+                + ". Request them again in the next step if you still need them."
+            )
+        messages.append(HumanMessage(content=content))
+        observed = True
+
+    yield {"type": "final", "output": MAX_STEPS_MESSAGE, "session_id": session_id, "streamed": False}
+
+
+async def arun_agent(inputs, max_steps=10, verbose=True):
+    result = {}
+    async for event in astream_agent(inputs, max_steps=max_steps, verbose=verbose):
+        if event["type"] == "final":
+            result = {"output": event["output"], "session_id": event["session_id"]}
+    return result
 
-        try:
-            if action == "save_user_profile":
-                try:
-                    info = json.loads(action_input) if isinstance(action_input, str) and (action_input.startswith("{") or action_input.startswith("[")) else {"info": action_input}
-                except:
-                    info = {"info": action_input}
-                memory.update_profile(info)
-                result = f"Successfully saved user info: {info}"
-            else:
-                try:
-                    if action == "api_agent" and isinstance(action_input, str) and not action_input.startswith("{"):
-                        actual_input = {"endpoint": action_input}
-                    else:
-                        actual_input = json.loads(action_input)
-                except:
-                    actual_input = action_input
-                
-                result = TOOLS[action].run(actual_input)
-
-            scratchpad += f"\nThought: {lines['Thought']}\nAction: {action}\nAction Input: {action_input}\nObservation: {result}\n"
-        except Exception as e:
-            scratchpad += f"\nThought: {lines['Thought']}\nAction: {action}\nAction Input: {action_input}\nObservation: Tool error - {str(e)}\n"
 
-    return {
-        "output": "I'm sorry, I couldn't complete the task within the maximum number of steps. Please try again or rephrase your request.",
-        "session_id": session_id,
-    }
+def run_agent(inputs, max_steps=10, verbose=True):
+    """Blocking entry point for scripts; async callers should use astream_agent/arun_agent."""
+    result = asyncio.run(arun_agent(inputs, max_steps=max_steps, verbose=verbose))
+    MemoryFunction(result["session_id"], inputs.get("user_id", "default_user")).refresh_summary()
+    return result
 
 
 agent_executor = run_agent
@@ -0,0 +1,118 @@
+import os
+import re
+import time
+import logging
+from collections import Counter
+from app.tools.misc_tools import current_time, joke_generator, solve_math
+
+logger = logging.getLogger(__name__)
+
+# Below this the question goes to the full agent
+ROUTER_MIN_CONFIDENCE = float(os.getenv("ROUTER_MIN_CONFIDENCE", "0.9"))
+# A routed request skips at least the first ReAct step and the Final Answer step
+LLM_CALLS_PER_AGENT_RUN = 2
+
+FILLER_RE = re.compile(r"^(hey|hi|hello|ok|okay|please|pls|can you|could you|would you|tell me|show me|give me)\s+", re.I)
+TRAILING_RE = re.compile(r"\s+(please|pls|now|right now|today|for me)$", re.I)
+MATH_PREFIX_RE = re.compile(r"^(what is|what's|whats|calculate|compute|solve|evaluate)\s+", re.I)
+EXPRESSION_RE = re.compile(r"^[\d\s+\-*/().]+$")
+# A bare expression must space its operators ("12 * 4"): "2024-01-01" or "5/6" could be a date
+SPACED_OPERATOR_RE = re.compile(r"[\d)]\s+[+\-*/]\s+[\d(]")
+BINARY_OPERATOR_RE = re.compile(r"[\d)]\s*[+\-*/]\s*[\d(]")
+# Dates, phone numbers, IDs: never arithmetic, even after "what is"
+DIGIT_CHAIN_RE = re.compile(r"\d+(?:\s*-\s*\d+){2,}")
+
+TIME_PHRASES = {
+    "time", "the time", "current time", "the current time", "time now",
+    "what time is it", "what is the time", "what's the time", "whats the time",
+    "what is the current time", "what's the current time",
+    "date", "the date", "today's date", "todays date", "current date", "the current date",
+    "what is the date", "what's the date", "whats the date", "what is today's date",
+    "what's today's date", "what day is it", "date and time",
+    "what is the current date and time", "current date and time",
+}
+JOKE_PHRASES = {
+    "joke", "a joke", "tell a joke", "another joke", "a random joke", "random joke",
+    "say a joke", "make me laugh", "i want a joke", "i want to hear a joke", "tell me something funny",
+}
+
+stats = Counter()
+
+
+def _normalize(question: str) -> str:
+    text = question.strip().lower().rstrip("?!. ")
+    # Strip leading/trailing filler repeatedly ("hey can you tell me ...")
+    previous = None
+    while previous != text:
+        previous = text
+        text = TRAILING_RE.sub("", FILLER_RE.sub("", text)).strip()
+    return " ".join(text.split())
+
+
+def route(question: str) -> dict | None:
+    """Decide whether a question can skip the agent. Returns {intent, tool, input, confidence} or None."""
+    text = _normalize(question)
+
+    if text in TIME_PHRASES:
+        return {"intent": "time", "tool": current_time, "input": "", "confidence": 1.0}
+
+    if text in JOKE_PHRASES:
+        return {"intent": "joke", "tool": joke_generator, "input": "", "confidence": 1.0}
+
+    expression = MATH_PREFIX_RE.sub("", text).strip()
+    explicit = expression != text or expression.endswith("=")
+    expression = expression.rstrip("= ")
+    if (
+        EXPRESSION_RE.match(expression)
+        and BINARY_OPERATOR_RE.search(expression)
+        and (explicit or SPACED_OPERATOR_RE.search(expression))
+        and not DIGIT_CHAIN_RE.search(expression)
+        # "**" could ask eval for an enormous power
+        and "**" not in expression
+    ):
+        return {"intent": "math", "tool": solve_math, "input": expression, "confidence": 1.0}
+
+    # Mentions a fast-path intent but says more than that: let the agent reason about it
+    if "joke" in text or re.search(r"\btime\b", text):
+        return {"intent": "ambiguous", "tool": None, "input": "", "confidence": 0.3}
+    return None
+
+
+def format_reply(intent: str, tool_input: str, result: str) -> str:
+    if intent == "time":
+        return f"The current date and time is {result}."
+    if intent == "math":
+        return f"{tool_input} = {result}"
+    return result
+
+
+async def try_fast_path(question: str) -> dict | None:
+    """Answer trivial requests directly with their tool. None means: use the agent."""
+    start = time.perf_counter()
+    decision = route(question)
+
+    if not decision or decision["confidence"] < ROUTER_MIN_CONFIDENCE:
+        stats["fallback"] += 1
+        logger.info(
+            "Router: fallback to agent (intent=%s) in %.2f ms",
+            decision["intent"] if decision else None, (time.perf_counter() - start) * 1000,
+        )
+        return None
+
+    try:
+        result = await decision["tool"].arun(decision["input"])
+    except Exception as e:
+        stats["tool_errors"] += 1
+        logger.warning(f"Router: {decision['intent']} tool failed, falling back to agent: {e}")
+        return None
+
+    stats[f"routed_{decision['intent']}"] += 1
+    stats["llm_calls_avoided"] += LLM_CALLS_PER_AGENT_RUN
+    logger.info(
+        "Router: %s answered directly in %.2f ms",
+        decision["intent"], (time.perf_counter() - start) * 1000,
+    )
+    return {
+        "intent": decision["intent"],
+        "output": format_reply(decision["intent"], decision["input"], str(result)),
+    }
@@ -0,0 +1,104 @@
+import os
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+import httpx
+
+logger = logging.getLogger(__name__)
+
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "10"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_MAX_CONNECTIONS_PER_HOST = int(os.getenv("HTTP_MAX_CONNECTIONS_PER_HOST", "10"))
+# Bodies are read in a stream and cut off here, before they reach memory or the prompt
+HTTP_MAX_RESPONSE_BYTES = int(os.getenv("HTTP_MAX_RESPONSE_BYTES", "1000000"))
+
+# One pooled client per event loop (the app has one; run_agent's asyncio.run makes its own)
+_client: httpx.AsyncClient | None = None
+_client_loop = None
+_host_limits: dict[str, asyncio.Semaphore] = {}
+_closing: set[asyncio.Task] = set()
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+async def _aclose_quietly(client: httpx.AsyncClient):
+    try:
+        await client.aclose()
+    except Exception as e:
+        logger.debug(f"Closing a replaced HTTP client failed: {e}")
+
+
+def _close_replaced(client: httpx.AsyncClient, client_loop, loop):
+    """Release the pool of a client whose event loop is no longer the current one."""
+    if not client_loop.is_closed():
+        # Its connections belong to that loop, so close them there
+        asyncio.run_coroutine_threadsafe(_aclose_quietly(client), client_loop)
+    else:
+        task = loop.create_task(_aclose_quietly(client))
+        _closing.add(task)
+        task.add_done_callback(_closing.discard)
+
+
+def get_http_client() -> httpx.AsyncClient:
+    global _client, _client_loop, _host_limits
+    loop = asyncio.get_running_loop()
+    if _client is None or _client_loop is not loop:
+        if _client is not None:
+            _close_replaced(_client, _client_loop, loop)
+        _client = httpx.AsyncClient(
+            timeout=HTTP_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            ),
+            http2=_http2_available(),
+            follow_redirects=True,
+        )
+        _client_loop = loop
+        _host_limits = {}
+    return _client
+
+
+@asynccontextmanager
+async def _host_limit(url: str):
+    # httpx only limits the pool as a whole; cap what a single host can take from it
+    host = urlsplit(url).netloc
+    semaphore = _host_limits.setdefault(host, asyncio.Semaphore(HTTP_MAX_CONNECTIONS_PER_HOST))
+    async with semaphore:
+        yield
+
+
+async def fetch_text(url: str, params: dict | None = None, max_bytes: int = HTTP_MAX_RESPONSE_BYTES) -> tuple[str, bool]:
+    """GET url and return (body text, truncated). Raises httpx.HTTPStatusError on 4xx/5xx."""
+    client = get_http_client()
+    async with _host_limit(url):
+        async with client.stream("GET", url, params=params) as response:
+            response.raise_for_status()
+            chunks = []
+            size = 0
+            truncated = False
+            async for chunk in response.aiter_bytes():
+                if size + len(chunk) > max_bytes:
+                    chunks.append(chunk[:max_bytes - size])
+                    truncated = True
+                    break
+                chunks.append(chunk)
+                size += len(chunk)
+            text = b"".join(chunks).decode(response.encoding or "utf-8", errors="replace")
+    return text, truncated
+
+
+async def aclose_http_client():
+    global _client, _client_loop
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+        _client_loop = None
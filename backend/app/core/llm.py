@@ -1,13 +1,468 @@
 import os
-from langchain_openai import AzureChatOpenAI
+import json
+import time
+import random
+import asyncio
+import logging
+import threading
+from collections import Counter, deque
 from dotenv import load_dotenv
+from app.core.scheduler import (
+    AZURE_OPENAI_RPM,
+    AZURE_OPENAI_TPM,
+    LLM_COMPLETION_TOKENS_ESTIMATE,
+    RateLimited,
+    RateLimiter,
+)
+from app.helper.token_budget import count_tokens
 
 load_dotenv()
 
-llm = AzureChatOpenAI(
-    api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-    azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-    azure_deployment=os.getenv("AZURE_OPENAI_MODEL"),
-    api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
-    temperature=0.2,
-)
+logger = logging.getLogger(__name__)
+
+# JSON list of deployments to spread load over, e.g.
+# [{"name": "eastus", "endpoint": "...", "deployment": "gpt-4", "api_key": "...", "tpm": 80000, "rpm": 480}, ...]
+# Missing fields (and the whole list, if unset) fall back to the single AZURE_OPENAI_* deployment.
+AZURE_OPENAI_DEPLOYMENTS = os.getenv("AZURE_OPENAI_DEPLOYMENTS", "")
+
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "10"))
+# Longest a call waits for any deployment to have quota before giving up
+LLM_QUOTA_MAX_WAIT = float(os.getenv("LLM_QUOTA_MAX_WAIT", "30"))
+
+# Consecutive failures (5xx, timeouts, connection errors) that open a deployment's breaker
+LLM_BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", "5"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+
+# Start a second request on another deployment when the first is slower than this latency percentile
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+LATENCY_WINDOW = 200
+MIN_HEDGE_SAMPLES = 20
+
+
+def _deployment_configs() -> list[dict]:
+    default = {
+        "name": os.getenv("AZURE_OPENAI_MODEL") or "default",
+        "endpoint": os.getenv("AZURE_OPENAI_ENDPOINT"),
+        "deployment": os.getenv("AZURE_OPENAI_MODEL"),
+        "api_key": os.getenv("AZURE_OPENAI_API_KEY"),
+        "api_version": os.getenv("AZURE_OPENAI_API_VERSION"),
+        "tpm": AZURE_OPENAI_TPM,
+        "rpm": AZURE_OPENAI_RPM,
+    }
+    if not AZURE_OPENAI_DEPLOYMENTS:
+        return [default]
+    return [
+        {**default, "name": f"{config.get('deployment', default['deployment'])}-{i}", **config}
+        for i, config in enumerate(json.loads(AZURE_OPENAI_DEPLOYMENTS))
+    ]
+
+
+def _prompt_tokens(prompt) -> int:
+    if isinstance(prompt, str):
+        return count_tokens(prompt)
+    # Rough per-message overhead on top of the content, as in the chat format
+    return sum(count_tokens(m.content) + 4 for m in prompt)
+
+
+def _total_tokens(usage: dict | None) -> int | None:
+    return usage.get("total_tokens") if usage else None
+
+
+def _status_code(error: Exception) -> int | None:
+    return getattr(error, "status_code", None)
+
+
+def _is_retryable(error: Exception) -> bool:
+    status = _status_code(error)
+    if status is not None:
+        return status == 429 or status >= 500
+    return isinstance(error, (asyncio.TimeoutError, TimeoutError)) or type(error).__name__ in (
+        "APITimeoutError", "APIConnectionError",
+    )
+
+
+def _retry_after(error: Exception) -> float | None:
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def _backoff(attempt: int, error: Exception) -> float:
+    delay = min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.5)
+    retry_after = _retry_after(error)
+    if retry_after is not None:
+        delay = max(delay, min(retry_after, LLM_BACKOFF_MAX))
+    return delay
+
+
+# ---------- Deployments ----------
+
+class CircuitBreaker:
+    """
+    Opens after threshold consecutive failures. Once the cooldown has passed it is half-open:
+    a single trial call goes through while the rest stay away; its success closes the
+    breaker and its failure re-opens it for another cooldown.
+    """
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self._lock = threading.Lock()
+
+    def _passable(self) -> bool:
+        if self.opened_at is None:
+            return True
+        return not self.probing and time.monotonic() - self.opened_at >= self.cooldown
+
+    def available(self) -> bool:
+        with self._lock:
+            return self._passable()
+
+    def retry_in(self) -> float:
+        """Seconds until a call could be let through (an estimate while a trial call is running)."""
+        with self._lock:
+            if self._passable():
+                return 0.0
+            if self.probing:
+                return LLM_BACKOFF_BASE
+            return self.opened_at + self.cooldown - time.monotonic()
+
+    def acquire(self) -> bool:
+        """Claim a call. Always granted while closed; when half-open only the trial call gets it."""
+        with self._lock:
+            if not self._passable():
+                return False
+            if self.opened_at is not None:
+                self.probing = True
+            return True
+
+    def release(self):
+        """The claimed call ended without telling us anything about health (cancelled, 4xx, not sent)."""
+        with self._lock:
+            self.probing = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self) -> bool:
+        """Returns True if this failure opened (or re-opened) the breaker."""
+        with self._lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+                self.probing = False
+                return True
+            return False
+
+
+class Deployment:
+    def __init__(self, config: dict):
+        from langchain_openai import AzureChatOpenAI
+
+        self.name = config["name"]
+        self.client = AzureChatOpenAI(
+            api_key=config["api_key"],
+            azure_endpoint=config["endpoint"],
+            azure_deployment=config["deployment"],
+            api_version=config["api_version"],
+            temperature=0.2,
+            # Report token usage on streamed responses too (per-step prompt/cached token counts)
+            stream_usage=True,
+            timeout=LLM_TIMEOUT,
+            # Retries are handled by LLMClient so they can move to another deployment
+            max_retries=0,
+        )
+        self.limiter = RateLimiter(int(config.get("tpm") or 0), int(config.get("rpm") or 0))
+        self.breaker = CircuitBreaker(LLM_BREAKER_THRESHOLD, LLM_BREAKER_COOLDOWN)
+        # Latency to the full response (invoke) or to the first token (stream).
+        # Appended from worker threads too (invoke), so guarded by a lock.
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self._latency_lock = threading.Lock()
+        # Set from Retry-After when Azure throttles us anyway
+        self.throttled_until = 0.0
+
+    def available(self) -> bool:
+        return time.monotonic() >= self.throttled_until and self.breaker.available()
+
+    def record_latency(self, latency: float):
+        with self._latency_lock:
+            self.latencies.append(latency)
+
+    def latency_percentile(self, percentile: float) -> float | None:
+        with self._latency_lock:
+            samples = sorted(self.latencies)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * percentile / 100))]
+
+    def score(self) -> float:
+        """Lower is better: typical latency, inflated as the remaining quota runs out."""
+        median = self.latency_percentile(50) or 0.0
+        return median / max(self.limiter.headroom(), 0.05)
+
+    def refund(self, estimate: int):
+        """Give back the tokens reserved for a call that produced nothing (failed or cancelled)."""
+        self.limiter.reconcile(estimate, 0)
+
+
+# ---------- Client ----------
+
+class LLMClient:
+    """
+    Chat model facade over one or more Azure OpenAI deployments. Each call goes to the
+    available deployment with the best latency/quota score, is retried with jittered
+    backoff on 429/5xx/timeouts (on another deployment when there is one), and can be
+    hedged with a second request when the first runs past the latency percentile.
+    """
+
+    def __init__(self, deployments: list[Deployment]):
+        self.deployments = deployments
+        self.stats = Counter()
+
+    # ---------- Routing ----------
+
+    def _select(self, estimate: int, exclude=()) -> tuple[Deployment | None, float]:
+        """Reserve quota on the best deployment that has it now. Returns (deployment, 0) or (None, seconds to wait)."""
+        remaining = [d for d in self.deployments if d not in exclude]
+        candidates = [d for d in remaining if d.available()]
+        if not candidates:
+            # Everything healthy is throttled: try the one that recovers soonest rather than failing outright.
+            # Broken deployments are left to their breaker's single trial call.
+            candidates = sorted((d for d in remaining if d.breaker.available()), key=lambda d: d.throttled_until)[:1]
+        if not candidates:
+            return None, min((d.breaker.retry_in() for d in remaining), default=0.0)
+
+        waits = []
+        for deployment in sorted(candidates, key=lambda d: d.score()):
+            if not deployment.breaker.acquire():
+                # Another request took the half-open trial call
+                waits.append(deployment.breaker.retry_in())
+                continue
+            wait = deployment.limiter.try_acquire(estimate)
+            if wait == 0:
+                return deployment, 0.0
+            deployment.breaker.release()
+            waits.append(wait)
+        return None, min(waits)
+
+    async def _areserve(self, estimate: int) -> Deployment:
+        deadline = time.monotonic() + LLM_QUOTA_MAX_WAIT
+        while True:
+            deployment, wait = self._select(estimate)
+            if deployment:
+                return deployment
+            if time.monotonic() + wait > deadline:
+                raise RateLimited(f"LLM quota exhausted; would need to wait {wait:.1f}s")
+            await asyncio.sleep(wait)
+
+    def _reserve(self, estimate: int) -> Deployment:
+        deadline = time.monotonic() + LLM_QUOTA_MAX_WAIT
+        while True:
+            deployment, wait = self._select(estimate)
+            if deployment:
+                return deployment
+            if time.monotonic() + wait > deadline:
+                raise RateLimited(f"LLM quota exhausted; would need to wait {wait:.1f}s")
+            time.sleep(wait)
+
+    # ---------- Outcome tracking ----------
+
+    def _record_success(self, deployment: Deployment, latency: float):
+        deployment.record_latency(latency)
+        deployment.breaker.record_success()
+        self.stats[f"{deployment.name}:success"] += 1
+
+    def _record_failure(self, deployment: Deployment, error: Exception):
+        self.stats[f"{deployment.name}:error"] += 1
+        if _status_code(error) == 429:
+            # Quota problem, not a health problem: steer traffic elsewhere until Retry-After
+            deployment.throttled_until = time.monotonic() + (_retry_after(error) or LLM_BACKOFF_BASE * 4)
+            self.stats[f"{deployment.name}:throttled"] += 1
+            deployment.breaker.release()
+        elif not _is_retryable(error):
+            deployment.breaker.release()
+        elif deployment.breaker.record_failure():
+            self.stats[f"{deployment.name}:breaker_open"] += 1
+            logger.warning("LLM deployment %s circuit opened after repeated failures: %s", deployment.name, error)
+
+    async def _attempt(self, deployment: Deployment, estimate: int, call):
+        start = time.monotonic()
+        try:
+            result = await call(deployment)
+        except asyncio.CancelledError:
+            # A hedge loser or a caller that went away
+            deployment.refund(estimate)
+            deployment.breaker.release()
+            raise
+        except Exception as e:
+            deployment.refund(estimate)
+            self._record_failure(deployment, e)
+            raise
+        self._record_success(deployment, time.monotonic() - start)
+        return result
+
+    async def _hedged(self, estimate: int, call, discard=None):
+        """
+        Run call on the best deployment, racing a second deployment if the first is unusually slow.
+        discard(result) cleans up the result of an attempt that finished but lost the race.
+        """
+        primary = await self._areserve(estimate)
+        task = asyncio.create_task(self._attempt(primary, estimate, call))
+        owners = {task: primary}
+        winner = None
+        try:
+            delay = primary.latency_percentile(LLM_HEDGE_PERCENTILE) if LLM_HEDGE_ENABLED else None
+            if delay is None or len(primary.latencies) < MIN_HEDGE_SAMPLES:
+                winner = task
+                return primary, await task
+
+            done, _ = await asyncio.wait({task}, timeout=delay)
+            if done:
+                winner = task
+                return primary, task.result()
+
+            backup, _ = self._select(estimate, exclude={primary})
+            if backup is None:
+                winner = task
+                return primary, await task
+
+            self.stats["hedges"] += 1
+            hedge = asyncio.create_task(self._attempt(backup, estimate, call))
+            owners[hedge] = backup
+            pending = set(owners)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for finished in done:
+                    if finished.exception() is None:
+                        if finished is hedge:
+                            self.stats["hedge_wins"] += 1
+                        winner = finished
+                        return owners[finished], finished.result()
+                    error = error or finished.exception()
+            raise error
+        finally:
+            for attempt, deployment in owners.items():
+                if not attempt.done():
+                    attempt.cancel()
+                elif attempt is not winner and not attempt.cancelled() and attempt.exception() is None:
+                    # Both finished in the same wakeup: the loser's reservation and result go unused
+                    deployment.refund(estimate)
+                    if discard:
+                        await discard(attempt.result())
+
+    async def _with_retries(self, estimate: int, call, discard=None):
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            try:
+                return await self._hedged(estimate, call, discard)
+            except Exception as e:
+                if not _is_retryable(e) or attempt == LLM_MAX_RETRIES:
+                    raise
+                self.stats["retries"] += 1
+                delay = _backoff(attempt, e)
+                logger.warning("LLM call failed (%s); retrying in %.2fs", e, delay)
+                await asyncio.sleep(delay)
+
+    # ---------- Public API ----------
+
+    async def ainvoke(self, prompt):
+        estimate = _prompt_tokens(prompt) + LLM_COMPLETION_TOKENS_ESTIMATE
+        deployment, response = await self._with_retries(
+            estimate, lambda d: d.client.ainvoke(prompt),
+        )
+        deployment.limiter.reconcile(estimate, _total_tokens(response.usage_metadata))
+        return response
+
+    async def astream(self, prompt):
+        """
+        Stream chunks from one deployment. Retries and hedging apply until the first
+        chunk arrives; a failure after that is raised since output was already emitted.
+        """
+        estimate = _prompt_tokens(prompt) + LLM_COMPLETION_TOKENS_ESTIMATE
+
+        async def first_chunk(deployment):
+            stream = deployment.client.astream(prompt)
+            try:
+                return stream, await stream.__anext__()
+            except BaseException:
+                await stream.aclose()
+                raise
+
+        async def close(result):
+            await result[0].aclose()
+
+        deployment, (stream, chunk) = await self._with_retries(estimate, first_chunk, discard=close)
+        usage = None
+        try:
+            while True:
+                if chunk.usage_metadata:
+                    usage = chunk.usage_metadata
+                yield chunk
+                try:
+                    chunk = await stream.__anext__()
+                except StopAsyncIteration:
+                    break
+        except Exception as e:
+            self._record_failure(deployment, e)
+            raise
+        finally:
+            await stream.aclose()
+            deployment.limiter.reconcile(estimate, _total_tokens(usage))
+
+    def invoke(self, prompt):
+        """Blocking call for code running in worker threads (e.g. the background summary refresh). No hedging."""
+        estimate = _prompt_tokens(prompt) + LLM_COMPLETION_TOKENS_ESTIMATE
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            deployment = self._reserve(estimate)
+            start = time.monotonic()
+            try:
+                response = deployment.client.invoke(prompt)
+            except Exception as e:
+                deployment.refund(estimate)
+                self._record_failure(deployment, e)
+                if not _is_retryable(e) or attempt == LLM_MAX_RETRIES:
+                    raise
+                self.stats["retries"] += 1
+                time.sleep(_backoff(attempt, e))
+                continue
+            self._record_success(deployment, time.monotonic() - start)
+            deployment.limiter.reconcile(estimate, _total_tokens(response.usage_metadata))
+            return response
+
+    def deployment_stats(self) -> dict:
+        return {
+            d.name: {
+                "available": d.available(),
+                "breaker_open": not d.breaker.available(),
+                "quota_headroom": round(d.limiter.headroom(), 3),
+                "p50_latency": d.latency_percentile(50),
+                "p95_latency": d.latency_percentile(95),
+            }
+            for d in self.deployments
+        }
+
+
+# Built on first use (or by warmup) so importing the app doesn't construct the Azure clients
+_llm: LLMClient | None = None
+_lock = threading.Lock()
+
+
+def get_llm() -> LLMClient:
+    global _llm
+    if _llm is None:
+        with _lock:
+            if _llm is None:
+                _llm = LLMClient([Deployment(config) for config in _deployment_configs()])
+    return _llm
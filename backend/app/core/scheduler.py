@@ -0,0 +1,188 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# ---------- Admission control ----------
+
+AGENT_MAX_CONCURRENCY = int(os.getenv("AGENT_MAX_CONCURRENCY", "16"))
+AGENT_MAX_QUEUE = int(os.getenv("AGENT_MAX_QUEUE", "64"))
+AGENT_MAX_PER_USER = int(os.getenv("AGENT_MAX_PER_USER", "2"))
+AGENT_QUEUE_TIMEOUT = float(os.getenv("AGENT_QUEUE_TIMEOUT", "30"))
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """One admitted agent run. release() is idempotent; callers release it in a finally."""
+
+    def __init__(self, scheduler: "AgentScheduler", user_id: str):
+        self.scheduler = scheduler
+        self.user_id = user_id
+        self.running = False
+        self.released = False
+
+    async def wait(self):
+        """Wait in the queue for a run slot; 503 after AGENT_QUEUE_TIMEOUT."""
+        try:
+            await asyncio.wait_for(self.scheduler.slots.acquire(), timeout=self.scheduler.queue_timeout)
+        except asyncio.TimeoutError:
+            self.release()
+            raise AdmissionRejected(503, "Server is busy, please retry shortly", retry_after=5)
+        except asyncio.CancelledError:
+            # The client went away while queued
+            self.release()
+            raise
+        self.running = True
+        self.scheduler.waiting -= 1
+
+    def release(self):
+        if self.released:
+            return
+        self.released = True
+        scheduler = self.scheduler
+        if self.running:
+            scheduler.slots.release()
+        else:
+            scheduler.waiting -= 1
+        scheduler.per_user[self.user_id] -= 1
+        if scheduler.per_user[self.user_id] <= 0:
+            del scheduler.per_user[self.user_id]
+
+
+class AgentScheduler:
+    """
+    Bounded work queue in front of the agent: at most max_concurrency runs at once,
+    at most max_queue waiting, and at most max_per_user runs (running or queued) per user.
+    Anything beyond that is rejected immediately instead of piling up.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, max_per_user: int, queue_timeout: float):
+        self.slots = asyncio.Semaphore(max_concurrency)
+        self.max_queue = max_queue
+        self.max_per_user = max_per_user
+        self.queue_timeout = queue_timeout
+        self.waiting = 0
+        self.per_user = Counter()
+
+    def reserve(self, user_id: str) -> Ticket:
+        if self.per_user[user_id] >= self.max_per_user:
+            raise AdmissionRejected(429, "Too many concurrent requests for this user", retry_after=2)
+        if self.waiting >= self.max_queue:
+            raise AdmissionRejected(503, "Server is busy, please retry shortly", retry_after=5)
+        self.per_user[user_id] += 1
+        self.waiting += 1
+        return Ticket(self, user_id)
+
+    async def admit(self, user_id: str) -> Ticket:
+        ticket = self.reserve(user_id)
+        await ticket.wait()
+        return ticket
+
+
+_scheduler: AgentScheduler | None = None
+
+
+def get_scheduler() -> AgentScheduler:
+    # Created inside the app's event loop on first request
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = AgentScheduler(AGENT_MAX_CONCURRENCY, AGENT_MAX_QUEUE, AGENT_MAX_PER_USER, AGENT_QUEUE_TIMEOUT)
+    return _scheduler
+
+
+# ---------- Azure quota (tokens/requests per minute) ----------
+
+# Defaults for the deployment configured through AZURE_OPENAI_*; 0 disables the limit
+AZURE_OPENAI_TPM = int(os.getenv("AZURE_OPENAI_TPM", "0"))
+AZURE_OPENAI_RPM = int(os.getenv("AZURE_OPENAI_RPM", "0"))
+# Completion tokens reserved per call before the real count is known
+LLM_COMPLETION_TOKENS_ESTIMATE = int(os.getenv("LLM_COMPLETION_TOKENS_ESTIMATE", "500"))
+
+
+class RateLimited(Exception):
+    pass
+
+
+class TokenBucket:
+    """Refills continuously at rate_per_minute, up to one minute's worth."""
+
+    def __init__(self, rate_per_minute: int):
+        self.capacity = float(rate_per_minute)
+        self.tokens = self.capacity
+        self.refill_per_sec = rate_per_minute / 60
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_per_sec)
+        self.updated = now
+
+    def try_take(self, amount: float) -> float:
+        """Take amount if available and return 0, else return the seconds until it will be."""
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return 0.0
+            return (amount - self.tokens) / self.refill_per_sec
+
+    def debit(self, amount: float):
+        """Take amount even if it isn't there: the deficit delays later try_take calls until refilled."""
+        with self._lock:
+            self._refill()
+            self.tokens -= amount
+
+    def give_back(self, amount: float):
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+    def headroom(self) -> float:
+        with self._lock:
+            self._refill()
+            return max(self.tokens, 0.0) / self.capacity
+
+
+class RateLimiter:
+    """Keeps one deployment's traffic under its TPM/RPM quota so bursts wait briefly instead of hitting 429s."""
+
+    def __init__(self, tpm: int, rpm: int):
+        self.tpm = TokenBucket(tpm) if tpm else None
+        self.rpm = TokenBucket(rpm) if rpm else None
+
+    def try_acquire(self, estimate: int) -> float:
+        """Reserve one request and estimate tokens if both are available now, else return the seconds to wait."""
+        if self.rpm and (wait := self.rpm.try_take(1)) > 0:
+            return wait
+        if self.tpm and (wait := self.tpm.try_take(estimate)) > 0:
+            if self.rpm:
+                self.rpm.give_back(1)
+            return wait
+        return 0.0
+
+    def headroom(self) -> float:
+        """Fraction of the minute's quota still available (1.0 when unlimited)."""
+        return min((bucket.headroom() for bucket in (self.tpm, self.rpm) if bucket), default=1.0)
+
+    def reconcile(self, estimate: int, actual_tokens: int | None):
+        """Return over-reserved tokens (or charge the shortfall) once the real usage is known."""
+        if self.tpm is None or actual_tokens is None:
+            return
+        if actual_tokens < estimate:
+            self.tpm.give_back(estimate - actual_tokens)
+        elif actual_tokens > estimate:
+            # Already spent against the quota, so charged even if the bucket runs into deficit
+            self.tpm.debit(actual_tokens - estimate)
@@ -0,0 +1,226 @@
+import os
+import time
+import logging
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from opentelemetry import trace
+from opentelemetry.trace import Status, StatusCode
+
+logger = logging.getLogger(__name__)
+
+# Spans are exported over OTLP/gRPC when an endpoint is configured; otherwise the tracer is a no-op
+OTEL_EXPORTER_OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "")
+OTEL_SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "agent-backend")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+STEP_BUCKETS = (1, 2, 3, 4, 5, 6, 8, 10)
+
+
+# ---------- Tracing ----------
+
+_tracing_configured = False
+
+
+def setup_tracing():
+    global _tracing_configured
+    if _tracing_configured or not OTEL_EXPORTER_OTLP_ENDPOINT:
+        return
+    from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+    provider = TracerProvider(resource=Resource.create({"service.name": OTEL_SERVICE_NAME}))
+    # The exporter reads the endpoint, headers and TLS settings from the standard OTEL_* variables
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    trace.set_tracer_provider(provider)
+    _tracing_configured = True
+    logger.info("Exporting traces to %s", OTEL_EXPORTER_OTLP_ENDPOINT)
+
+
+def shutdown_tracing():
+    provider = trace.get_tracer_provider()
+    if hasattr(provider, "shutdown"):
+        provider.shutdown()
+
+
+def get_tracer():
+    return trace.get_tracer("app")
+
+
+# ---------- Metrics (Prometheus text format) ----------
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+def _format_value(value: float) -> str:
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        with self._lock:
+            self.values[tuple(sorted(labels.items()))] += amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_format_labels(labels)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.series = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self.series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            index = bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, series in sorted(self.series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_format_labels(labels + (('le', bound),))} {cumulative}")
+                lines.append(f"{self.name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {series[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(series[-2])}")
+                lines.append(f"{self.name}_count{_format_labels(labels)} {series[-1]}")
+        return lines
+
+
+STAGE_SECONDS = Histogram("agent_stage_seconds", "Time spent in each stage of a request")
+TOOL_SECONDS = Histogram("agent_tool_seconds", "Tool call latency by tool")
+AGENT_STEPS = Histogram("agent_steps", "LLM steps per agent request", buckets=STEP_BUCKETS)
+AGENT_REQUESTS = Counter("agent_requests_total", "Agent requests by outcome")
+ERRORS = Counter("agent_errors_total", "Errors by stage and exception type")
+LLM_TOKENS = Counter("llm_tokens_total", "LLM tokens by kind")
+
+METRICS = [STAGE_SECONDS, TOOL_SECONDS, AGENT_STEPS, AGENT_REQUESTS, ERRORS, LLM_TOKENS]
+
+
+def _clean(attributes: dict) -> dict:
+    # OpenTelemetry attributes can't be None
+    return {k: v for k, v in attributes.items() if v is not None}
+
+
+@contextmanager
+def stage(name: str, parent=None, **attributes):
+    """
+    Time a block as a span (child of parent, if given) and an agent_stage_seconds sample.
+    The span is never made current, so it is safe to hold across yields in async generators.
+    """
+    context = trace.set_span_in_context(parent) if parent is not None else None
+    span = get_tracer().start_span(name, context=context, attributes=_clean(attributes))
+    start = time.perf_counter()
+    try:
+        yield span
+    except Exception as e:
+        span.record_exception(e)
+        span.set_status(Status(StatusCode.ERROR, str(e)))
+        ERRORS.inc(stage=name, error=type(e).__name__)
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=name)
+        span.end()
+
+
+def mark_failed(span, stage_name: str, error: str):
+    """Record a failure that was handled (and so never raised through stage())."""
+    span.set_status(Status(StatusCode.ERROR, error))
+    ERRORS.inc(stage=stage_name, error=error)
+
+
+# ---------- Component stats ----------
+
+def _gauge(name: str, help: str, samples: list[tuple[dict, float]]) -> list[str]:
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} gauge"]
+    for labels, value in samples:
+        lines.append(f"{name}{_format_labels(tuple(sorted(labels.items())))} {_format_value(value)}")
+    return lines
+
+
+def _component_metrics() -> list[str]:
+    """Counters the caches, router, guardrails, LLM client and scheduler already keep, read at scrape time."""
+    from app.agents import router
+    from app.core import llm, scheduler
+    from app.db import db
+    from app.helper import guardrails, semantic_cache
+    from app.tools.cache import get_tool_cache
+
+    lines = []
+
+    tool_stats = get_tool_cache().stats()
+    lines += _gauge("tool_cache_hits", "Tool cache hits by tool", [({"tool": t}, s["hits"]) for t, s in tool_stats.items()])
+    lines += _gauge("tool_cache_misses", "Tool cache misses by tool", [({"tool": t}, s["misses"]) for t, s in tool_stats.items()])
+
+    lines += _gauge("router_requests", "Fast-path router decisions", [({"result": k}, v) for k, v in router.stats.items()])
+
+    if semantic_cache._semantic_cache is not None:
+        lines += _gauge(
+            "semantic_cache", "Semantic answer cache counters",
+            [({"stat": k}, v) for k, v in semantic_cache._semantic_cache.metrics().items()],
+        )
+
+    profile_stats = db.profile_cache.stats()
+    lines += _gauge("profile_cache", "User profile cache", [({"stat": k}, v) for k, v in profile_stats.items()])
+
+    if guardrails._batcher is not None:
+        cache = guardrails._batcher.cache
+        lines += _gauge("guardrail_cache", "Guardrail verdict cache", [({"stat": "hits"}, cache.hits), ({"stat": "misses"}, cache.misses)])
+
+    if llm._llm is not None:
+        samples = []
+        for key, value in llm._llm.stats.items():
+            # "<deployment>:<result>", or just "<result>" for client-wide counters like retries
+            deployment, _, result = key.rpartition(":")
+            samples.append(({"deployment": deployment, "result": result}, value))
+        lines += _gauge("llm_calls", "LLM client outcomes by deployment", samples)
+        deployments = llm._llm.deployment_stats()
+        lines += _gauge("llm_deployment_available", "1 if the deployment is taking traffic", [({"deployment": n}, int(d["available"])) for n, d in deployments.items()])
+        lines += _gauge("llm_deployment_quota_headroom", "Fraction of the per-minute quota left", [({"deployment": n}, d["quota_headroom"]) for n, d in deployments.items()])
+
+    if scheduler._scheduler is not None:
+        lines += _gauge("agent_queue", "Agent runs waiting for a slot", [({}, scheduler._scheduler.waiting)])
+
+    return lines
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in METRICS:
+        lines += metric.render()
+    try:
+        lines += _component_metrics()
+    except Exception:
+        logger.exception("Collecting component metrics failed")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,85 @@
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from app.core import llm
+from app.core.llm import get_llm
+from app.db import mongo
+from app.helper import guardrails, token_budget
+from app.helper.guardrails import get_toxicity_batcher
+from app.helper.token_budget import get_encoding
+from app.vector import vectorstore
+from app.vector.vectorstore import ensure_vectorstore
+
+logger = logging.getLogger(__name__)
+
+# Heavy subsystems that are otherwise initialized lazily on the first request that needs them
+COMPONENTS = {
+    "mongo": mongo.get_client,
+    "llm": get_llm,
+    "guardrails": get_toxicity_batcher,
+    "tokenizer": get_encoding,
+    "vectorstore": ensure_vectorstore,
+}
+
+
+def _mongo_reachable() -> bool:
+    mongo.get_client().admin.command("ping")
+    return True
+
+
+# Whether each component is up right now, however it got loaded (warmup or a request)
+CHECKS = {
+    "mongo": _mongo_reachable,
+    "llm": lambda: llm._llm is not None,
+    "guardrails": lambda: guardrails._batcher is not None,
+    "tokenizer": lambda: token_budget._encoding is not None,
+    "vectorstore": lambda: vectorstore._vectorstore is not None,
+}
+
+# Outcome of the last warmup of each component
+_status: dict[str, dict] = {}
+_lock = threading.Lock()
+
+
+def _load(name: str):
+    start = time.perf_counter()
+    try:
+        COMPONENTS[name]()
+        result = {"ready": True}
+    except Exception as e:
+        logger.exception("Warmup of %s failed", name)
+        result = {"ready": False, "error": str(e)}
+    result["ms"] = round((time.perf_counter() - start) * 1000, 1)
+    with _lock:
+        _status[name] = result
+    return result
+
+
+def warmup() -> dict:
+    """Initialize every component in parallel; safe to call repeatedly."""
+    with ThreadPoolExecutor(max_workers=len(COMPONENTS), thread_name_prefix="warmup") as pool:
+        list(pool.map(_load, COMPONENTS))
+    return readiness()
+
+
+def _check(name: str) -> dict:
+    with _lock:
+        status = dict(_status.get(name, {}))
+    try:
+        status["ready"] = bool(CHECKS[name]())
+    except Exception as e:
+        status.update(ready=False, error=str(e))
+    if status["ready"]:
+        # A failed warmup that a later request recovered from
+        status.pop("error", None)
+    return status
+
+
+def readiness() -> dict:
+    """Checks the live components, so lazily loaded ones count even if warmup never ran."""
+    components = {name: _check(name) for name in COMPONENTS}
+    return {
+        "ready": all(c["ready"] for c in components.values()),
+        "components": components,
+    }
@@ -1,22 +1,42 @@
-from pymongo import MongoClient
-from datetime import datetime
 import os
-from dotenv import load_dotenv
+import itertools
+from datetime import datetime
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from app.db.legacy import LEGACY_PROJECTION, legacy_session_query, numbered_messages
+from app.db.mongo import get_database
+from app.helper.cache import BoundedCache
+
+TITLE_LENGTH = 40
+
+# Profiles are read on every agent turn but rarely change; writes from this process
+# invalidate immediately, writes from other workers show up within the TTL.
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "10000"))
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", "60"))
+profile_cache = BoundedCache(PROFILE_CACHE_SIZE, ttl=PROFILE_CACHE_TTL)
+# Stamped on a user by every profile write, so a read that overlapped one doesn't cache
+# what it fetched. Stamps come from one counter and never repeat, even after eviction.
+_profile_generations = BoundedCache(PROFILE_CACHE_SIZE)
+_generation_counter = itertools.count(1)
+
+
+def make_title(text: str) -> str:
+    return text.strip().splitlines()[0][:TITLE_LENGTH] if text.strip() else "New Chat"
 
-load_dotenv()
+
+def profile_field(key) -> str | None:
+    """A profile key usable as one path segment: no dots (nesting) or leading $ (operators)."""
+    key = str(key).replace(".", "_").lstrip("$").strip()
+    return key or None
 
 
 class MongoDBMemory:
     def __init__(self, session_id: str, user_id: str = "default_user"):
-        conn_str = os.getenv("CONNECTIONSTRING")
-        if not conn_str:
-            raise ValueError("CONNECTIONSTRING environment variable is not set")
-
-        self.client = MongoClient(conn_str)
-        db = self.client["agent_memory"]
+        db = get_database()
 
         self.conversations = db["conversations"]
         self.user_profiles = db["user_profiles"]
+        self.messages = db["messages"]
 
         self.session_id = session_id
         self.user_id = user_id
@@ -24,64 +44,142 @@ class MongoDBMemory:
     # ---------- User profile ----------
 
     def get_user_profile(self) -> dict:
-        doc = self.user_profiles.find_one({"user_id": self.user_id})
-        return doc.get("profile", {}) if doc else {}
+        profile = profile_cache.get(self.user_id)
+        if profile is None:
+            generation = _profile_generations.get(self.user_id)
+            doc = self.user_profiles.find_one({"user_id": self.user_id}, {"_id": 0, "profile": 1})
+            profile = doc.get("profile", {}) if doc else {}
+            if _profile_generations.get(self.user_id) == generation:
+                profile_cache.set(self.user_id, profile)
+        # Callers get their own copy so the cached one can't be mutated
+        return dict(profile)
 
     def update_user_profile(self, info):
-        profile = self.get_user_profile()
-
-        if isinstance(info, dict):
-            profile.update(info)
-        else:
-            profile["info"] = info
-
-        self.user_profiles.update_one(
-            {"user_id": self.user_id},
+        """Merge info into the stored profile with one atomic $set per field (no read first)."""
+        fields = info if isinstance(info, dict) else {"info": info}
+        updates = {f"profile.{name}": value for key, value in fields.items() if (name := profile_field(key))}
+        if not updates:
+            return
+
+        query = {"user_id": self.user_id}
+        update = {"$set": {**updates, "last_updated": datetime.utcnow()}}
+        try:
+            self.user_profiles.update_one(query, update, upsert=True)
+        except DuplicateKeyError:
+            # A concurrent upsert created the profile first; this time the update matches it
+            self.user_profiles.update_one(query, update, upsert=True)
+        # After the write: a read that started before it sees the new stamp and skips caching
+        _profile_generations.set(self.user_id, next(_generation_counter))
+        profile_cache.pop(self.user_id)
+
+    # ---------- Messages ----------
+    # One document per message in "messages", ordered by a per-session seq.
+    # The "conversations" document is only a session header (counter, title, timestamps).
+
+    def append_messages(self, messages: list[tuple[str, str]]) -> int:
+        """Append (role, content) pairs; returns the seq of the last one."""
+        now = datetime.utcnow()
+        query = {"session_id": self.session_id}
+        update = {
+            "$inc": {"message_count": len(messages)},
+            "$set": {"user_id": self.user_id, "last_updated": now},
+            "$setOnInsert": {"title": make_title(messages[0][1]) if messages[0][0] == "user" else "New Chat"},
+        }
+        try:
+            header = self.conversations.find_one_and_update(
+                query, update, projection={"message_count": 1}, upsert=True, return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            # A concurrent first turn created the header; this time the update matches it
+            header = self.conversations.find_one_and_update(
+                query, update, projection={"message_count": 1}, upsert=True, return_document=ReturnDocument.AFTER,
+            )
+        last_seq = header["message_count"]
+        first_seq = last_seq - len(messages) + 1
+        self.messages.insert_many([
             {
-                "$set": {
-                    "profile": profile,
-                    "last_updated": datetime.utcnow(),
-                }
-            },
-            upsert=True,
-        )
-
-    # ---------- Conversation ----------
+                "session_id": self.session_id,
+                "user_id": self.user_id,
+                "seq": first_seq + i,
+                "role": role,
+                "content": content,
+                "created_at": now,
+            }
+            for i, (role, content) in enumerate(messages)
+        ])
+        return last_seq
+
+    def get_messages(self, after_seq: int | None = None) -> list[dict]:
+        """Messages after after_seq, or the whole session (legacy ones included) if None."""
+        query = {"session_id": self.session_id}
+        if after_seq is not None:
+            query["seq"] = {"$gt": after_seq}
+        messages = list(self.messages.find(query, {"_id": 0, "seq": 1, "role": 1, "content": 1}).sort("seq", ASCENDING))
+        legacy = self.get_legacy_messages()
+        return [m for m in legacy if after_seq is None or m["seq"] > after_seq] + messages
+
+    def get_recent_messages(self, limit: int) -> list[dict]:
+        cursor = self.messages.find(
+            {"session_id": self.session_id},
+            {"_id": 0, "seq": 1, "role": 1, "content": 1},
+        ).sort("seq", DESCENDING).limit(limit)
+        messages = list(cursor)[::-1]
+        if len(messages) < limit:
+            # Unmigrated legacy messages are older than all of them
+            messages = self.get_legacy_messages()[-(limit - len(messages)):] + messages
+        return messages
+
+    def get_legacy_messages(self) -> list[dict]:
+        """Messages still in legacy documents (see app.db.legacy), numbered below the stored ones."""
+        docs = list(self.conversations.find(legacy_session_query([self.session_id]), LEGACY_PROJECTION).sort("_id", ASCENDING))
+        if not docs:
+            return []
+        header = self.conversations.find_one({"session_id": self.session_id}, {"min_seq": 1}) or {}
+        return numbered_messages(docs, header.get("min_seq"))
 
     def get_conversation(self) -> str:
-        doc = self.conversations.find_one({"session_id": self.session_id})
-        return doc.get("conversation", "") if doc else ""
+        return "".join(f"{m['role']}: {m['content']}\n" for m in self.get_messages())
+
+    # ---------- Session header ----------
 
-    def save_conversation(self, conversation: str):
-        self.conversations.update_one(
+    def get_session(self) -> dict:
+        doc = self.conversations.find_one(
             {"session_id": self.session_id},
+            {"_id": 0, "message_count": 1, "min_seq": 1, "summary": 1, "summary_seq": 1},
+        )
+        return doc or {}
+
+    def save_summary(self, summary: str, summary_seq: int, expected_seq: int) -> bool:
+        """Store the rolling summary only if nobody advanced the watermark since we read it."""
+        result = self.conversations.update_one(
+            {"session_id": self.session_id, "summary_seq": expected_seq or {"$in": [0, None]}},
             {
                 "$set": {
-                    "session_id": self.session_id,
-                    "user_id": self.user_id,
-                    "conversation": conversation,
-                    "last_updated": datetime.utcnow(),
+                    "summary": summary,
+                    "summary_seq": summary_seq,
+                    "summary_updated": datetime.utcnow(),
                 }
             },
-            upsert=True,
         )
+        return result.modified_count == 1
 
     def delete_session(self):
-        self.conversations.delete_one({"session_id": self.session_id})
+        self.conversations.delete_many({"$or": [{"session_id": self.session_id}, {"SessionId": self.session_id}]})
+        self.messages.delete_many({"session_id": self.session_id})
 
     # ---------- list all ----------
 
     @classmethod
     def list_all_sessions(cls):
-        client = MongoClient(os.getenv("CONNECTIONSTRING"))
-        collection = client["agent_memory"]["conversations"]
+        collection = get_database()["conversations"]
         return list(
             collection.find(
                 {},
                 {
                     "session_id": 1,
                     "user_id": 1,
-                    "conversation": 1,
+                    "title": 1,
+                    "message_count": 1,
                     "last_updated": 1,
                 },
             )
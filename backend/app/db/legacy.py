@@ -0,0 +1,80 @@
+"""
+Legacy session formats, read until app.db.migrate has converted them:
+- {"SessionId": ..., "History": [...]}: the original chat history documents
+- {"session_id": ..., "conversation": "user: ...\\nassistant: ..."}: the single-string format
+
+Their messages are older than anything in "messages", so they are placed below the
+session's lowest seq (the header's min_seq, 0 if none): the read paths number them
+exactly as the migration will store them.
+"""
+import json
+
+LEGACY_FIELDS = ("SessionId", "History", "conversation")
+LEGACY_QUERY = {"$or": [{field: {"$exists": True}} for field in LEGACY_FIELDS]}
+LEGACY_PROJECTION = {"SessionId": 1, "session_id": 1, "History": 1, "conversation": 1}
+
+
+def parse_conversation(conversation: str) -> list[tuple[str, str]]:
+    """
+    Parse the "role: content" conversation string; unprefixed lines continue the previous
+    message. Text before the first prefix is kept as a user message rather than dropped.
+    """
+    messages = []
+    for line in conversation.split("\n"):
+        if line.startswith("user: ") or line.startswith("assistant: "):
+            role, content = line.split(": ", 1)
+            messages.append([role, content])
+        elif messages:
+            if line.strip():
+                messages[-1][1] += "\n" + line
+        elif line.strip():
+            messages.append(["user", line])
+    return [tuple(m) for m in messages]
+
+
+def parse_history(history) -> list[tuple[str, str]]:
+    """LangChain-style History: a list of message dicts, or one JSON-encoded message."""
+    if isinstance(history, str):
+        try:
+            history = [json.loads(history)]
+        except json.JSONDecodeError:
+            return []
+    messages = []
+    for msg in history if isinstance(history, list) else []:
+        if not isinstance(msg, dict):
+            continue
+        # message_to_dict nests the fields under "data"
+        data = msg.get("data") if isinstance(msg.get("data"), dict) else msg
+        m_type = msg.get("type") or data.get("type") or data.get("role")
+        content = data.get("content") or data.get("text")
+        if not content:
+            continue
+        if m_type in ("human", "user"):
+            messages.append(("user", content))
+        elif m_type in ("ai", "assistant"):
+            messages.append(("assistant", content))
+    return messages
+
+
+def legacy_messages(doc: dict) -> list[tuple[str, str]]:
+    if doc.get("conversation"):
+        return parse_conversation(doc["conversation"])
+    return parse_history(doc.get("History"))
+
+
+def legacy_session_query(session_ids: list[str]) -> dict:
+    """Legacy documents of these sessions; sort by _id for the order the migration uses."""
+    return {"$and": [
+        {"$or": [{"session_id": {"$in": session_ids}}, {"SessionId": {"$in": session_ids}}]},
+        LEGACY_QUERY,
+    ]}
+
+
+def numbered_messages(docs: list[dict], min_seq: int | None) -> list[dict]:
+    """The legacy docs' messages (docs in _id order) with the seqs the migration will give them."""
+    messages = [m for doc in docs for m in legacy_messages(doc)]
+    first_seq = (min_seq or 0) - len(messages)
+    return [
+        {"seq": first_seq + i, "role": role, "content": content}
+        for i, (role, content) in enumerate(messages)
+    ]
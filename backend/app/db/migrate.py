@@ -0,0 +1,412 @@
+"""
+Rewrite legacy session documents (see app.db.legacy) into the current schema.
+
+Each session becomes a header in "conversations" (session_id, user_id, title,
+message_count, last_updated) plus one document per message in "messages". Legacy
+messages predate anything appended since the upgrade, so they get seqs below the
+session's lowest one (counted down by the header's min_seq). Until a session is
+migrated the read paths serve its legacy messages with those same seqs. Headers
+whose last_updated is an ISO string are also rewritten to hold a date, and duplicate
+headers and user_profiles documents (left by concurrent first upserts) are merged so
+the unique session_id and user_id indexes can be built.
+
+Run from backend/:
+    python -m app.db.migrate [--batch-size 200] [--pause 0.1] [--dry-run] [--restart]
+
+Progress is checkpointed in the "migrations" collection after every batch, so an
+interrupted run resumes where it stopped; once a run finishes, the next one starts a
+new pass over whatever legacy documents remain. Safe to re-run: a session whose seq
+range was reserved but whose header wasn't committed is completed on the next run.
+Documents that parse to no messages are left untouched and reported as skipped.
+"""
+import sys
+import json
+import time
+import logging
+import argparse
+from uuid import uuid4
+from datetime import datetime, timezone
+from pymongo import ASCENDING, DeleteOne, InsertOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+from app.db.db import make_title
+from app.db.legacy import LEGACY_FIELDS, LEGACY_QUERY, legacy_messages, legacy_session_query
+from app.db.mongo import ensure_indexes, get_database
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_ID = "legacy_sessions"
+DUPLICATE_KEY = 11000
+
+
+def as_datetime(value):
+    """
+    Timestamps are stored as naive UTC datetimes; some older documents hold ISO strings,
+    which sort apart from dates and fall out of /sessions' keyset paging. None if unparseable.
+    """
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value if isinstance(value, datetime) else None
+
+
+class LegacySessionMigration:
+    def __init__(self, db, batch_size: int, pause: float, dry_run: bool):
+        self.conversations = db["conversations"]
+        self.messages = db["messages"]
+        self.checkpoints = db["migrations"]
+        self.profiles = db["user_profiles"]
+        self.batch_size = batch_size
+        self.pause = pause
+        self.dry_run = dry_run
+        self.stats = {"documents": 0, "sessions": 0, "messages": 0, "skipped": 0, "timestamps": 0, "profiles": 0, "headers": 0}
+
+    # ---------- Checkpoints ----------
+
+    def load_checkpoint(self):
+        """Where to resume. A finished run starts a new pass, so documents it skipped get another go."""
+        doc = self.checkpoints.find_one({"_id": MIGRATION_ID})
+        if not doc or doc.get("done"):
+            return None
+        return doc.get("last_id")
+
+    def save_checkpoint(self, last_id, batch_stats: dict | None = None, done: bool = False):
+        update = {"$set": {"last_id": last_id, "done": done, "updated_at": datetime.utcnow()}}
+        if batch_stats:
+            update["$inc"] = {f"stats.{k}": v for k, v in batch_stats.items()}
+        self.checkpoints.update_one({"_id": MIGRATION_ID}, update, upsert=True)
+
+    def reset_checkpoint(self):
+        self.checkpoints.delete_one({"_id": MIGRATION_ID})
+
+    # ---------- Planning ----------
+
+    def plan(self, docs: list[dict]) -> tuple[dict, list]:
+        """
+        Group a batch by session, pulling in each session's other legacy documents so its
+        whole legacy history is placed at once, in _id order. The first legacy document is
+        converted in place unless the session already has a current-format header; the
+        rest are merged into the target and deleted. Documents of the batch that parse to
+        no messages are returned separately and left untouched.
+        """
+        batch_ids = {doc["_id"] for doc in docs}
+        session_ids = {doc.get("session_id") or doc.get("SessionId") for doc in docs} - {None}
+        docs = list(self.conversations.find(legacy_session_query(list(session_ids))).sort("_id", ASCENDING))
+        headers = {
+            h["session_id"]: h
+            for h in self.conversations.find(
+                {"session_id": {"$in": list(session_ids)}, **{f: {"$exists": False} for f in LEGACY_FIELDS}},
+                {"session_id": 1, "user_id": 1, "title": 1, "min_seq": 1, "last_updated": 1, "merged_legacy_ids": 1, "migration_pending": 1},
+            )
+        }
+
+        # A "conversation" document is also the header live appends have been counting on
+        live = {}
+        for doc in docs:
+            if doc.get("session_id"):
+                live.setdefault(doc["session_id"], doc)
+
+        sessions = {}
+        unparsed = []
+        blocked = set()
+        for doc in docs:
+            session_id = doc.get("session_id") or doc.get("SessionId")
+            if not session_id or session_id in blocked:
+                continue
+            parsed = legacy_messages(doc)
+            if not parsed:
+                # Unsetting the legacy fields would lose whatever the document holds
+                if doc["_id"] in batch_ids:
+                    unparsed.append(doc["_id"])
+                if live.get(session_id) is doc and session_id not in headers:
+                    # It would have to be the target; leave the whole session as it is
+                    blocked.add(session_id)
+                    sessions.pop(session_id, None)
+                continue
+            plan = sessions.get(session_id)
+            if plan is None:
+                target = headers.get(session_id) or live.get(session_id) or doc
+                plan = sessions[session_id] = {
+                    "target": target,
+                    "title": target.get("title"),
+                    "user_id": target.get("user_id") or doc.get("user_id") or "default_user",
+                    "last_updated": as_datetime(target.get("last_updated")) or as_datetime(doc.get("last_updated")),
+                    "messages": [],
+                    "sources": [],
+                    "merge": [],
+                    "delete": [],
+                }
+            if doc["_id"] != plan["target"]["_id"]:
+                if doc["_id"] in plan["target"].get("merged_legacy_ids", []):
+                    # Merged by an earlier run that stopped before deleting it
+                    plan["delete"].append(doc["_id"])
+                    continue
+                plan["merge"].append(doc["_id"])
+            plan["sources"].append(doc["_id"])
+
+            doc_updated = as_datetime(doc.get("last_updated"))
+            created_at = doc_updated or datetime.utcnow()
+            for role, content in parsed:
+                plan["messages"].append((role, content, created_at))
+            if plan["last_updated"] is None or (doc_updated and doc_updated > plan["last_updated"]):
+                plan["last_updated"] = doc_updated
+        return sessions, unparsed
+
+    # ---------- Writing ----------
+    # Per session: reserve a seq range below the session's lowest seq by counting the
+    # header's min_seq down (live appends count message_count up, so the two never meet),
+    # insert the messages there, then commit by unsetting the legacy fields. The
+    # reservation is recorded on the header as migration_pending, so a run that stops
+    # part way reuses it instead of reserving again.
+
+    def reserve(self, sessions: dict, batch_id: str):
+        """Set plan["first_seq"] and plan["pending_batch"]; sessions whose header is gone are dropped."""
+        for session_id, plan in list(sessions.items()):
+            target_id = plan["target"]["_id"]
+            count = len(plan["messages"])
+            pending = plan["target"].get("migration_pending") or {}
+            if (
+                pending.get("first_seq") is not None
+                and pending.get("count") == count
+                and sorted(map(str, pending.get("sources", []))) == sorted(map(str, plan["sources"]))
+            ):
+                plan["first_seq"], plan["pending_batch"] = pending["first_seq"], pending["batch"]
+                continue
+            if pending:
+                # Reserved for a different set of documents by an interrupted run: its rows go, the seqs stay unused
+                logger.warning("Session %s: discarding an interrupted reservation %s", session_id, pending)
+                if pending.get("first_seq") is not None:
+                    self.messages.delete_many({
+                        "session_id": session_id,
+                        "legacy": True,
+                        "seq": {"$gte": pending["first_seq"], "$lt": pending["first_seq"] + pending["count"]},
+                    })
+
+            header = self.conversations.find_one_and_update(
+                {"_id": target_id},
+                {
+                    "$inc": {"min_seq": -count},
+                    "$set": {"migration_pending": {"batch": batch_id, "count": count, "sources": plan["sources"]}},
+                },
+                projection={"min_seq": 1},
+                return_document=ReturnDocument.AFTER,
+            )
+            if header is None:
+                # Deleted since it was read (e.g. the user deleted the session)
+                del sessions[session_id]
+                continue
+            plan["first_seq"] = header["min_seq"]
+            plan["pending_batch"] = batch_id
+            self.conversations.update_one(
+                {"_id": target_id, "migration_pending.batch": batch_id},
+                {"$set": {"migration_pending.first_seq": plan["first_seq"]}},
+            )
+
+    def write_messages(self, sessions: dict):
+        """Insert every planned message at its reserved seq. Re-runs hit duplicate keys, which are fine."""
+        ops = []
+        for session_id, plan in sessions.items():
+            for i, (role, content, created_at) in enumerate(plan["messages"]):
+                ops.append(InsertOne({
+                    "session_id": session_id,
+                    "user_id": plan["user_id"],
+                    "seq": plan["first_seq"] + i,
+                    "role": role,
+                    "content": content,
+                    "created_at": created_at,
+                    "legacy": True,
+                }))
+        if not ops:
+            return
+        try:
+            self.messages.bulk_write(ops, ordered=False)
+        except BulkWriteError as e:
+            other = [err for err in e.details.get("writeErrors", []) if err.get("code") != DUPLICATE_KEY]
+            if other:
+                raise
+
+    def write_headers(self, sessions: dict):
+        """Commit point: turn each target into a current-format header and release its reservation."""
+        ops = []
+        for session_id, plan in sessions.items():
+            messages = plan["messages"]
+            update = {
+                "$set": {
+                    "session_id": session_id,
+                    "user_id": plan["user_id"],
+                    "title": plan["title"] or make_title(messages[0][1]),
+                },
+                # Live appends may have moved it past the legacy timestamps already
+                "$max": {"last_updated": plan["last_updated"] or datetime.utcnow()},
+                "$unset": {**{field: "" for field in LEGACY_FIELDS}, "migration_pending": ""},
+            }
+            if plan["merge"]:
+                # Recorded in the same atomic update, so a re-run never merges them twice
+                update["$addToSet"] = {"merged_legacy_ids": {"$each": plan["merge"]}}
+            ops.append(UpdateOne({"_id": plan["target"]["_id"], "migration_pending.batch": plan["pending_batch"]}, update))
+        if ops:
+            self.conversations.bulk_write(ops, ordered=False)
+
+    def finish(self, sessions: dict, batch_stats: dict):
+        """Delete the legacy documents merged into committed sessions."""
+        ops = []
+        for plan in sessions.values():
+            ops += [DeleteOne({"_id": legacy_id}) for legacy_id in plan["merge"] + plan["delete"]]
+            batch_stats["sessions"] += 1
+            batch_stats["messages"] += len(plan["messages"])
+        if ops:
+            self.conversations.bulk_write(ops, ordered=False)
+
+    def normalize_timestamps(self) -> int:
+        """Store string last_updated values on current-format headers as dates. Returns how many there were."""
+        query = {"last_updated": {"$type": "string"}, **{f: {"$exists": False} for f in LEGACY_FIELDS}}
+        if self.dry_run:
+            return self.conversations.count_documents(query)
+        found = 0
+        while True:
+            docs = list(self.conversations.find(query, {"last_updated": 1}).limit(self.batch_size))
+            if not docs:
+                return found
+            found += len(docs)
+            ops = []
+            for doc in docs:
+                raw = doc["last_updated"]
+                value = as_datetime(raw)
+                # Unparseable ones become undated (listed last) and keep the original text
+                update = {"$set": {"last_updated": value}} if value else {"$set": {"last_updated": None, "last_updated_raw": raw}}
+                ops.append(UpdateOne({"_id": doc["_id"], "last_updated": raw}, update))
+            self.conversations.bulk_write(ops, ordered=False)
+
+    # ---------- Duplicates ----------
+    # Left by racing upserts from before the unique indexes; merged so those can be built
+
+    def merge_duplicate_headers(self) -> int:
+        """
+        Fold each session's current-format headers into the one with the highest
+        message_count (the counter later appends used) and delete the rest. Messages are
+        keyed by session_id, so they need no change. Returns how many headers were extra.
+        """
+        duplicates = list(self.conversations.aggregate([
+            {"$match": {"session_id": {"$exists": True}, **{f: {"$exists": False} for f in LEGACY_FIELDS}}},
+            {"$group": {"_id": "$session_id", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+            {"$match": {"count": {"$gt": 1}}},
+        ]))
+        extra = sum(group["count"] - 1 for group in duplicates)
+        if self.dry_run:
+            return extra
+        for group in duplicates:
+            docs = list(self.conversations.find({"_id": {"$in": group["ids"]}}))
+            keep = max(docs, key=lambda d: d.get("message_count") or 0)
+            others = [d for d in docs if d is not keep]
+            update = {"$min": {"min_seq": min(d.get("min_seq") or 0 for d in docs)}}
+            dates = [value for d in docs if (value := as_datetime(d.get("last_updated")))]
+            if dates:
+                update["$max"] = {"last_updated": max(dates)}
+            if not keep.get("title"):
+                update["$set"] = {"title": next((d["title"] for d in others if d.get("title")), "New Chat")}
+            self.conversations.update_one({"_id": keep["_id"]}, update)
+            self.conversations.delete_many({"_id": {"$in": [d["_id"] for d in others]}})
+            logger.info("Merged %d headers of session %s", len(docs), group["_id"])
+        return extra
+
+    def merge_duplicate_profiles(self) -> int:
+        """
+        Fold every user's profile documents into their most recently updated one (newer
+        values win per field) and delete the rest. Returns how many documents were extra.
+        """
+        duplicates = list(self.profiles.aggregate([
+            {"$group": {"_id": "$user_id", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+            {"$match": {"count": {"$gt": 1}}},
+        ]))
+        extra = sum(group["count"] - 1 for group in duplicates)
+        if self.dry_run:
+            return extra
+        for group in duplicates:
+            docs = list(self.profiles.find({"_id": {"$in": group["ids"]}}).sort("last_updated", ASCENDING))
+            profile = {}
+            for doc in docs:
+                profile.update(doc.get("profile") or {})
+            keep = docs[-1]
+            self.profiles.update_one({"_id": keep["_id"]}, {"$set": {"profile": profile}})
+            self.profiles.delete_many({"_id": {"$in": [doc["_id"] for doc in docs[:-1]]}})
+            logger.info("Merged %d profile documents for user %s", len(docs), group["_id"])
+        return extra
+
+    # ---------- Run ----------
+
+    def run(self, restart: bool = False) -> dict:
+        self.stats["profiles"] = self.merge_duplicate_profiles()
+        self.stats["headers"] = self.merge_duplicate_headers()
+        if not self.dry_run:
+            # The unique indexes the app can't build over duplicates, and the (session_id, seq) one the writes rely on
+            ensure_indexes(rebuild=True)
+        if restart and not self.dry_run:
+            self.reset_checkpoint()
+        last_id = None if restart else self.load_checkpoint()
+        if last_id is not None:
+            logger.info("Resuming after %s", last_id)
+
+        while True:
+            query = {**LEGACY_QUERY, **({"_id": {"$gt": last_id}} if last_id is not None else {})}
+            docs = list(self.conversations.find(query).sort("_id", ASCENDING).limit(self.batch_size))
+            if not docs:
+                break
+
+            sessions, unparsed = self.plan(docs)
+            batch_stats = {"documents": len(docs), "sessions": 0, "messages": 0, "skipped": len(unparsed)}
+            if unparsed:
+                logger.warning("Left %d legacy documents with no parseable messages untouched: %s", len(unparsed), unparsed)
+            if self.dry_run:
+                batch_stats["sessions"] = len(sessions)
+                batch_stats["messages"] = sum(len(p["messages"]) for p in sessions.values())
+            else:
+                planned = len(sessions)
+                self.reserve(sessions, uuid4().hex)
+                batch_stats["skipped"] += planned - len(sessions)
+                self.write_messages(sessions)
+                self.write_headers(sessions)
+                self.finish(sessions, batch_stats)
+
+            last_id = docs[-1]["_id"]
+            for key, value in batch_stats.items():
+                self.stats[key] += value
+            if not self.dry_run:
+                self.save_checkpoint(last_id, batch_stats)
+            logger.info(
+                "Migrated %d documents so far (%d sessions, %d messages, %d skipped)",
+                self.stats["documents"], self.stats["sessions"], self.stats["messages"], self.stats["skipped"],
+            )
+            if self.pause:
+                time.sleep(self.pause)
+
+        self.stats["timestamps"] = self.normalize_timestamps()
+        if not self.dry_run:
+            self.save_checkpoint(last_id, done=True)
+            # A "conversation" document sharing its session_id with a header blocks that index until merged above
+            ensure_indexes(rebuild=True)
+        return self.stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--pause", type=float, default=0.1, help="seconds to sleep between batches")
+    parser.add_argument("--dry-run", action="store_true", help="report what would be migrated without writing")
+    parser.add_argument("--restart", action="store_true", help="ignore the saved checkpoint")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    migration = LegacySessionMigration(get_database(), args.batch_size, args.pause, args.dry_run)
+    stats = migration.run(restart=args.restart)
+    print(json.dumps({"dry_run": args.dry_run, **stats}, indent=2))
+    remaining = migration.conversations.count_documents(LEGACY_QUERY)
+    if remaining and not args.dry_run:
+        logger.warning("%d legacy documents remain (unparseable or deleted mid-run); see the log above", remaining)
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
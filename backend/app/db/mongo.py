@@ -1,8 +1,120 @@
 import os
-from pymongo import MongoClient
+import logging
+import threading
+from pymongo import ASCENDING, DESCENDING, MongoClient
+from pymongo.errors import OperationFailure
+from motor.motor_asyncio import AsyncIOMotorClient
+from dotenv import load_dotenv
 
-class MongoDBMemory:
-    def __init__(self): 
-        mongo_client = MongoClient(os.getenv("CONNECTIONSTRING"))
-        mongo_db = mongo_client["agent_memory"]
-        mongo_collection = mongo_db["conversations"]
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+DB_NAME = "agent_memory"
+
+# One client per process; each one owns a connection pool shared by every request
+_client: MongoClient | None = None
+_async_client: AsyncIOMotorClient | None = None
+_lock = threading.Lock()
+
+
+def _connection_string() -> str:
+    conn_str = os.getenv("CONNECTIONSTRING")
+    if not conn_str:
+        raise ValueError("CONNECTIONSTRING environment variable is not set")
+    return conn_str
+
+
+def _client_options() -> dict:
+    return {
+        "maxPoolSize": int(os.getenv("MONGO_MAX_POOL_SIZE", "50")),
+        "minPoolSize": int(os.getenv("MONGO_MIN_POOL_SIZE", "0")),
+        "maxIdleTimeMS": int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "300000")),
+        "serverSelectionTimeoutMS": int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000")),
+    }
+
+
+# ---------- Sync (pymongo) ----------
+
+def get_client() -> MongoClient:
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = MongoClient(_connection_string(), **_client_options())
+    return _client
+
+
+def get_database():
+    return get_client()[DB_NAME]
+
+
+# ---------- Async (motor) ----------
+
+def get_async_client() -> AsyncIOMotorClient:
+    global _async_client
+    if _async_client is None:
+        with _lock:
+            if _async_client is None:
+                _async_client = AsyncIOMotorClient(_connection_string(), **_client_options())
+    return _async_client
+
+
+def get_async_database():
+    return get_async_client()[DB_NAME]
+
+
+# ---------- Indexes ----------
+
+def ensure_unique_index(collection, key: str, rebuild: bool = False, **options) -> bool:
+    """
+    Build a unique index on key. Databases written before it existed may hold duplicates,
+    which make the build fail; that is logged rather than raised so the app still starts,
+    and `python -m app.db.migrate` merges them and calls this again with rebuild=True
+    to replace the old non-unique index of the same name.
+    """
+    name = f"{key}_1"
+    try:
+        if rebuild:
+            existing = collection.index_information().get(name)
+            if existing and not existing.get("unique"):
+                collection.drop_index(name)
+        collection.create_index(key, unique=True, **options)
+        return True
+    except OperationFailure as e:
+        logger.error(
+            "Can't build the unique %s index on %s (%s); run `python -m app.db.migrate` to merge duplicates",
+            key, collection.name, e,
+        )
+        return False
+
+
+def ensure_indexes(rebuild: bool = False):
+    db = get_database()
+    # One header per session, so two racing first turns can't each create one.
+    # Legacy SessionId documents have no session_id, hence the partial filter
+    ensure_unique_index(
+        db["conversations"], "session_id", rebuild,
+        partialFilterExpression={"session_id": {"$exists": True}},
+    )
+    # Legacy lookups by the old key, until app.db.migrate has converted those documents
+    db["conversations"].create_index("SessionId", sparse=True)
+    # Keyset pagination of /sessions, overall and per user
+    db["conversations"].create_index([("last_updated", DESCENDING), ("_id", DESCENDING)])
+    db["conversations"].create_index([("user_id", ASCENDING), ("last_updated", DESCENDING), ("_id", DESCENDING)])
+    db["messages"].create_index([("session_id", ASCENDING), ("seq", ASCENDING)], unique=True)
+    # One profile per user, so concurrent first upserts can't create two
+    ensure_unique_index(db["user_profiles"], "user_id", rebuild)
+
+
+# ---------- Lifecycle ----------
+
+def close_clients():
+    global _client, _async_client
+    with _lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+        if _async_client is not None:
+            _async_client.close()
+            _async_client = None
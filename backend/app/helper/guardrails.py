@@ -1,14 +1,175 @@
-from llm_guard.input_scanners import Toxicity as InputToxicity 
-from llm_guard.input_scanners.toxicity import MatchType as InputMatchType 
-from llm_guard.output_scanners import Toxicity as OutputToxicity 
-from llm_guard.output_scanners.toxicity import MatchType as OutputMatchType 
+import os
+import asyncio
+import hashlib
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from app.helper.cache import BoundedCache
+
+# llm_guard pulls in transformers/torch, so it is imported on first use rather than at app import
+
+logger = logging.getLogger(__name__)
+
+TOXICITY_THRESHOLD = 0.5
+GUARDRAIL_USE_ONNX = os.getenv("GUARDRAIL_USE_ONNX", "false").lower() == "true"
+GUARDRAIL_MAX_BATCH_SIZE = int(os.getenv("GUARDRAIL_MAX_BATCH_SIZE", "32"))
+GUARDRAIL_MAX_WAIT_MS = float(os.getenv("GUARDRAIL_MAX_WAIT_MS", "10"))
+GUARDRAIL_CACHE_SIZE = int(os.getenv("GUARDRAIL_CACHE_SIZE", "4096"))
+
+# Labels the llm_guard Toxicity scanners treat as toxic
+TOXIC_LABELS = {
+    "toxicity",
+    "severe_toxicity",
+    "obscene",
+    "threat",
+    "insult",
+    "identity_attack",
+    "sexual_explicit",
+}
+
+
+class ToxicityBatcher:
+    """
+    Scores sentences from concurrent requests in micro-batches.
+    A worker thread drains the queue until it has max_batch_size sentences or
+    max_wait_ms has passed, then runs them through the classifier in one forward pass.
+    Verdicts for recently seen sentences are served from an LRU cache keyed by text hash.
+    """
+
+    def __init__(self, pipeline, max_batch_size: int, max_wait_ms: float, cache_size: int):
+        self.pipeline = pipeline
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.cache = BoundedCache(cache_size)
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="guardrail-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, sentences: list[str]) -> list[Future]:
+        futures = []
+        for sentence in sentences:
+            key = hashlib.sha256(sentence.encode("utf-8")).hexdigest()
+            future = Future()
+            score = self.cache.get(key)
+            if score is not None:
+                future.set_result(score)
+            else:
+                self._queue.put((key, sentence, future))
+            futures.append(future)
+        return futures
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            # One bad batch must not kill the worker, or every later check would wait forever
+            try:
+                self._score(batch)
+            except Exception:
+                logger.exception("Guardrail batcher failed on a batch of %d sentences", len(batch))
+
+    def _score(self, batch):
+        # A request that went away cancels its futures; setting a result on those would raise
+        batch = [item for item in batch if item[2].set_running_or_notify_cancel()]
+        if not batch:
+            return
+
+        # The same sentence can arrive from several requests in one window
+        unique = {}
+        for key, sentence, _ in batch:
+            unique.setdefault(key, sentence)
+
+        try:
+            texts = list(unique.values())
+            results = self.pipeline(texts, batch_size=len(texts))
+        except Exception as e:
+            logger.exception("Guardrail batch of %d sentences failed", len(unique))
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+
+        scores = {}
+        for key, labels in zip(unique, results):
+            if isinstance(labels, dict):
+                labels = [labels]
+            scores[key] = max((l["score"] for l in labels if l["label"] in TOXIC_LABELS), default=0.0)
+            self.cache.set(key, scores[key])
+
+        for key, _, future in batch:
+            future.set_result(scores[key])
+
+
+# The scanner loads a transformer model, so it is built on first use (or by warmup), not at import.
+# Input and output checks share its model through the batcher.
+_batcher: ToxicityBatcher | None = None
+_lock = threading.Lock()
+
+
+def get_toxicity_batcher() -> ToxicityBatcher:
+    global _batcher
+    if _batcher is None:
+        with _lock:
+            if _batcher is None:
+                from llm_guard.input_scanners import Toxicity as InputToxicity
+                from llm_guard.input_scanners.toxicity import MatchType as InputMatchType
+
+                scanner = InputToxicity(
+                    threshold=TOXICITY_THRESHOLD,
+                    match_type=InputMatchType.SENTENCE,
+                    use_onnx=GUARDRAIL_USE_ONNX,
+                )
+                _batcher = ToxicityBatcher(
+                    scanner._pipeline,
+                    max_batch_size=GUARDRAIL_MAX_BATCH_SIZE,
+                    max_wait_ms=GUARDRAIL_MAX_WAIT_MS,
+                    cache_size=GUARDRAIL_CACHE_SIZE,
+                )
+    return _batcher
+
+
+def _submit(text: str) -> list[Future]:
+    from llm_guard.input_scanners.toxicity import MatchType as InputMatchType
+
+    return get_toxicity_batcher().submit(InputMatchType.SENTENCE.get_inputs(text))
+
+
+def _verdict(text: str, scores: list[float]):
+    """Same (text, is_valid, risk_score) contract as llm_guard's scan()."""
+    from llm_guard.util import calculate_risk_score
+
+    highest = max(scores, default=0.0)
+    if highest > TOXICITY_THRESHOLD:
+        logger.warning("Detected toxic content (score %.2f)", highest)
+        return text, False, calculate_risk_score(highest, TOXICITY_THRESHOLD)
+    return text, True, calculate_risk_score(highest, TOXICITY_THRESHOLD)
 
-# Initialize Scanners
-input_toxicity_scanner = InputToxicity(threshold=0.5, match_type=InputMatchType.SENTENCE) 
-output_toxicity_scanner = OutputToxicity(threshold=0.5, match_type=OutputMatchType.SENTENCE) 
 
 def input_guardrail_check(text: str): 
-    return input_toxicity_scanner.scan(text) 
+    if not text.strip():
+        return text, True, -1.0
+    return _verdict(text, [f.result() for f in _submit(text)])
+
 
 def output_guardrail_check(prompt: str, output: str): 
-    return output_toxicity_scanner.scan(prompt, output)
+    return input_guardrail_check(output)
+
+
+async def ainput_guardrail_check(text: str):
+    if not text.strip():
+        return text, True, -1.0
+    scores = await asyncio.gather(*(asyncio.wrap_future(f) for f in _submit(text)))
+    return _verdict(text, list(scores))
+
+
+async def aoutput_guardrail_check(prompt: str, output: str):
+    return await ainput_guardrail_check(output)
@@ -1,15 +1,23 @@
-from app.core.llm import llm
+import os
+import logging
+from app.core.llm import get_llm
 from app.db.db import MongoDBMemory
-from langchain_classic.memory import ConversationSummaryMemory
+from app.helper.token_budget import TokenBudget, count_tokens
+from langchain_core.messages import AIMessage, HumanMessage, get_buffer_string
+
+logger = logging.getLogger(__name__)
+
+# Unsummarized messages to accumulate before folding them into the stored summary.
+# Keep it <= the recent-message window so nothing falls out of context in between.
+SUMMARY_THRESHOLD = int(os.getenv("SUMMARY_THRESHOLD", "6"))
+RECENT_MESSAGES = 6
 
 
 class MemoryFunction:
     def __init__(self, session_id: str, user_id: str):
         self.db = MongoDBMemory(session_id, user_id)
-        self.summary_memory = ConversationSummaryMemory(
-            llm=llm,
-            memory_key="chat_summary"
-        )
+        # Set by get_full_context: whether the prompt carried this user's profile or history
+        self.has_context = False
 
     # ---------- Basic storage ----------
 
@@ -17,56 +25,79 @@ class MemoryFunction:
         return self.db.get_conversation() or ""
 
     def add_message(self, role: str, content: str):
-        self.db.save_conversation(
-            self.load_history() + f"{role}: {content}\n"
-        )
+        self.db.append_messages([(role, content)])
+
+    def add_messages(self, messages: list[tuple[str, str]]):
+        self.db.append_messages(messages)
 
     # ---------- Summarization ----------
 
     def get_summary(self) -> str:
-        history = self.load_history()
-        if not history:
-            return ""
-
-        self.summary_memory.clear()
-
-        for line in history.splitlines():
-            if line.startswith("user:"):
-                self.summary_memory.chat_memory.add_user_message(
-                    line.replace("user:", "").strip()
-                )
-            elif line.startswith("assistant:"):
-                self.summary_memory.chat_memory.add_ai_message(
-                    line.replace("assistant:", "").strip()
-                )
-
-        return self.summary_memory.load_memory_variables({}).get("chat_summary", "")
+        return self.db.get_session().get("summary", "")
+
+    def refresh_summary(self) -> bool:
+        """
+        Fold messages past the summary watermark into the stored summary.
+        Meant to run in the background after the response is sent.
+        """
+        session = self.db.get_session()
+        # None: nothing summarized yet. Migrated legacy messages sit at seqs <= 0 (see app.db.legacy)
+        watermark = session.get("summary_seq")
+        first = watermark if watermark is not None else session.get("min_seq", 0)
+        if session.get("message_count", 0) - first < SUMMARY_THRESHOLD:
+            return False
+
+        messages = self.db.get_messages(after_seq=watermark)
+        if not messages:
+            return False
+
+        new_lines = []
+        for message in messages:
+            if message["role"] == "user":
+                new_lines.append(HumanMessage(content=message["content"]))
+            elif message["role"] == "assistant":
+                new_lines.append(AIMessage(content=message["content"]))
+
+        # Same progressive-summary prompt ConversationSummaryMemory uses, sent through the shared LLM client
+        from langchain_classic.memory.prompt import SUMMARY_PROMPT
+
+        prompt = SUMMARY_PROMPT.format(summary=session.get("summary", ""), new_lines=get_buffer_string(new_lines))
+        summary = get_llm().invoke(prompt).content
+        saved = self.db.save_summary(summary, messages[-1]["seq"], watermark)
+        if not saved:
+            logger.info("Summary for session %s was updated concurrently; skipping", self.db.session_id)
+        return saved
 
     # ---------- Short-term memory ----------
 
-    def get_recent_messages(self, limit: int = 6) -> str:
-        lines = [l for l in self.load_history().splitlines() if l.strip()]
-        return "\n".join(lines[-limit:])
+    def get_recent_messages(self, limit: int = RECENT_MESSAGES) -> str:
+        messages = self.db.get_recent_messages(limit)
+        return "\n".join(f"{m['role']}: {m['content']}" for m in messages)
 
     # ---------- Context assembly ----------
 
-    def get_full_context(self) -> str:
+    def get_full_context(self, budget: TokenBudget | None = None) -> str:
+        budget = budget or TokenBudget()
         parts = []
 
         profile = self.db.get_user_profile()
         if profile:
-            parts.append(f"User Profile:\n{profile}")
+            parts.append(f"User Profile:\n{budget.fit(str(profile), budget.profile_tokens)}")
 
+        # Recent messages matter most; the summary gets at most half of the history budget
         summary = self.get_summary()
         if summary:
+            summary = budget.fit(summary, budget.history_tokens // 2)
             parts.append(f"Conversation Summary:\n{summary}")
 
         recent = self.get_recent_messages()
         if recent:
+            recent_tokens = budget.history_tokens - (count_tokens(summary) if summary else 0)
+            recent = budget.fit(recent, recent_tokens, keep="tail")
             parts.append(f"Recent Messages:\n{recent}")
-        
-        print(parts)
+        logger.debug("Context for session %s: %s", self.db.session_id, parts)
 
+        self.has_context = bool(parts)
         return "\n\n".join(parts) if parts else "No previous history."
 
     # ---------- Long-term profile ----------
@@ -0,0 +1,131 @@
+import os
+import re
+import time
+import logging
+import threading
+from collections import Counter, OrderedDict
+from uuid import uuid4
+import numpy as np
+from app.vector.vectorstore import get_query_embeddings, normalize_query
+
+logger = logging.getLogger(__name__)
+
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "3600"))
+# Answers built from api_agent responses reflect live data, so they expire sooner
+SEMANTIC_CACHE_LIVE_TTL = float(os.getenv("SEMANTIC_CACHE_LIVE_TTL", "300"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "2000"))
+
+# Questions whose answer depends on when they're asked, or on what was said just before
+VOLATILE_RE = re.compile(r"\b(time|date|today|now|current|latest|random|joke|weather|news)\b", re.I)
+FOLLOW_UP_RE = re.compile(r"\b(it|that|those|them|these|again|previous|above|same|more)\b", re.I)
+PERSONAL_RE = re.compile(r"\b(my|mine|myself|who am i|about me)\b", re.I)
+
+VOLATILE_TOOLS = {"current_time", "joke_generator"}
+LIVE_DATA_TOOLS = {"api_agent", "tavily_search"}
+
+
+def is_cacheable_question(question: str) -> bool:
+    return not VOLATILE_RE.search(question) and not FOLLOW_UP_RE.search(question)
+
+
+def uses_personal_context(question: str, has_context: bool, tools_used: set) -> bool:
+    """
+    Personal answers are only ever served back to the same user. Any answer whose prompt
+    carried the user's profile, summary or chat history counts, since it may draw on them
+    without quoting them.
+    """
+    return has_context or "save_user_profile" in tools_used or bool(PERSONAL_RE.search(question))
+
+
+class SemanticCache:
+    """
+    Prior answers keyed by question embedding. A lookup returns the most similar
+    unexpired answer above the threshold from the shared scope or the user's own scope.
+    """
+
+    def __init__(self, embeddings, threshold: float, ttl: float, live_ttl: float, max_entries: int):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.ttl = ttl
+        self.live_ttl = live_ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # id -> (scope, vector, answer, expires_at)
+        self.stats = Counter()
+        self._lock = threading.Lock()
+
+    def _embed(self, question: str) -> np.ndarray:
+        vector = np.asarray(self.embeddings.embed_query(normalize_query(question)), dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def lookup(self, question: str, user_id: str) -> str | None:
+        if not is_cacheable_question(question):
+            self.stats["skipped"] += 1
+            return None
+
+        vector = self._embed(question)
+        scopes = {"global", f"user:{user_id}"}
+        now = time.time()
+        with self._lock:
+            for key in [k for k, e in self.entries.items() if e[3] <= now]:
+                del self.entries[key]
+            candidates = [(k, e) for k, e in self.entries.items() if e[0] in scopes]
+            if not candidates:
+                self.stats["misses"] += 1
+                return None
+
+            similarities = np.stack([e[1] for _, e in candidates]) @ vector
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self.stats["misses"] += 1
+                return None
+
+            key, entry = candidates[best]
+            self.entries.move_to_end(key)
+            self.stats["hits"] += 1
+        logger.info("Semantic cache hit (similarity %.3f)", similarities[best])
+        return entry[2]
+
+    def store(self, question: str, user_id: str, answer: str, personal: bool, tools_used: set):
+        if not is_cacheable_question(question) or tools_used & VOLATILE_TOOLS:
+            return
+        ttl = self.live_ttl if tools_used & LIVE_DATA_TOOLS else self.ttl
+        scope = f"user:{user_id}" if personal else "global"
+        vector = self._embed(question)
+        with self._lock:
+            self.entries[uuid4().hex] = (scope, vector, answer, time.time() + ttl)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self.stats["stores"] += 1
+
+    def metrics(self) -> dict:
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "entries": len(self.entries),
+                "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else 0.0,
+            }
+
+
+_semantic_cache: SemanticCache | None = None
+_lock = threading.Lock()
+
+
+def get_semantic_cache() -> SemanticCache | None:
+    """None unless SEMANTIC_CACHE_ENABLED is set."""
+    global _semantic_cache
+    if not SEMANTIC_CACHE_ENABLED:
+        return None
+    if _semantic_cache is None:
+        with _lock:
+            if _semantic_cache is None:
+                _semantic_cache = SemanticCache(
+                    get_query_embeddings(),
+                    threshold=SEMANTIC_CACHE_THRESHOLD,
+                    ttl=SEMANTIC_CACHE_TTL,
+                    live_ttl=SEMANTIC_CACHE_LIVE_TTL,
+                    max_entries=SEMANTIC_CACHE_MAX_ENTRIES,
+                )
+    return _semantic_cache
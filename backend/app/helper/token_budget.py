@@ -0,0 +1,127 @@
+import os
+import json
+import logging
+import tiktoken
+
+logger = logging.getLogger(__name__)
+
+# cl100k_base matches the GPT-4 family; override for other deployments
+TOKEN_ENCODING = os.getenv("TOKEN_ENCODING", "cl100k_base")
+
+# Total tokens the agent may spend on context it adds around the question,
+# split between the user profile, conversation history and tool observations.
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "8000"))
+PROFILE_SHARE = float(os.getenv("PROFILE_TOKEN_SHARE", "0.05"))
+HISTORY_SHARE = float(os.getenv("HISTORY_TOKEN_SHARE", "0.25"))
+OBSERVATION_SHARE = float(os.getenv("OBSERVATION_TOKEN_SHARE", "0.70"))
+
+# A single observation never gets more than this, nor less than the floor once the budget runs low
+MAX_OBSERVATION_TOKENS = int(os.getenv("MAX_OBSERVATION_TOKENS", "2000"))
+MIN_OBSERVATION_TOKENS = 200
+
+# JSON pruning steps tried in order until an observation fits: (max list items, max string chars)
+JSON_PRUNE_STEPS = [(20, 500), (10, 200), (5, 100), (3, 60), (1, 40)]
+
+_encoding = None
+
+
+def get_encoding():
+    global _encoding
+    if _encoding is None:
+        _encoding = tiktoken.get_encoding(TOKEN_ENCODING)
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    return len(get_encoding().encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, max_tokens: int, keep: str = "both") -> str:
+    """
+    Cut text down to max_tokens.
+    keep="both" keeps the head and the tail (most documents and payloads put
+    the useful parts at the ends); keep="tail" keeps only the most recent part.
+    """
+    if max_tokens <= 0:
+        # tokens[-0:] below would be the whole list
+        return ""
+    encoding = get_encoding()
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+
+    dropped = len(tokens) - max_tokens
+    marker = f"\n... [{dropped} tokens truncated] ...\n"
+    if keep == "tail":
+        return marker.lstrip() + encoding.decode(tokens[-max_tokens:])
+
+    head = max_tokens * 2 // 3
+    tail = max_tokens - head
+    return encoding.decode(tokens[:head]) + marker + encoding.decode(tokens[len(tokens) - tail:])
+
+
+def prune_json(value, max_items: int, max_chars: int):
+    """Shrink a parsed JSON value: keep the first max_items of each list and cut long strings."""
+    if isinstance(value, dict):
+        return {k: prune_json(v, max_items, max_chars) for k, v in value.items()}
+    if isinstance(value, list):
+        pruned = [prune_json(v, max_items, max_chars) for v in value[:max_items]]
+        if len(value) > max_items:
+            pruned.append(f"... {len(value) - max_items} more items")
+        return pruned
+    if isinstance(value, str) and len(value) > max_chars:
+        return value[:max_chars] + "..."
+    return value
+
+
+def compact_text(text: str, max_tokens: int) -> str:
+    """Fit a tool observation into max_tokens, pruning JSON structurally before falling back to head/tail trimming."""
+    if count_tokens(text) <= max_tokens:
+        return text
+
+    try:
+        data = json.loads(text)
+    except (ValueError, TypeError):
+        data = None
+
+    if isinstance(data, (dict, list)):
+        for max_items, max_chars in JSON_PRUNE_STEPS:
+            pruned = json.dumps(prune_json(data, max_items, max_chars), ensure_ascii=False, separators=(",", ":"))
+            if count_tokens(pruned) <= max_tokens:
+                return pruned
+        text = pruned
+
+    return truncate_tokens(text, max_tokens)
+
+
+class TokenBudget:
+    """Per-run token budget; tracks how many tokens compaction kept out of the prompt."""
+
+    def __init__(self, total: int = CONTEXT_TOKEN_BUDGET):
+        self.total = total
+        self.profile_tokens = int(total * PROFILE_SHARE)
+        self.history_tokens = int(total * HISTORY_SHARE)
+        self.observation_tokens = int(total * OBSERVATION_SHARE)
+        self.observations_used = 0
+        self.saved = 0
+
+    def fit(self, text: str, max_tokens: int, keep: str = "both") -> str:
+        before = count_tokens(text)
+        if before <= max_tokens:
+            return text
+        fitted = truncate_tokens(text, max_tokens, keep=keep)
+        self.saved += before - count_tokens(fitted)
+        return fitted
+
+    def fit_observation(self, text: str) -> str:
+        remaining = self.observation_tokens - self.observations_used
+        limit = max(MIN_OBSERVATION_TOKENS, min(MAX_OBSERVATION_TOKENS, remaining))
+
+        before = count_tokens(text)
+        if before > limit:
+            text = compact_text(text, limit)
+        after = count_tokens(text)
+
+        self.saved += before - after
+        self.observations_used += after
+        return text
@@ -1,10 +1,34 @@
+import os
+import asyncio
+import threading
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.core import config
+from fastapi.responses import JSONResponse, PlainTextResponse
+from app.core import config, http, telemetry, warmup
+from app.db import mongo
 from app.routes.ask import router as ask_router
 from app.routes.history import router as history_router
 
-app = FastAPI(title="Gemini FastAPI")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Create the pooled Mongo clients once per process; close them and the HTTP pool on shutdown
+    telemetry.setup_tracing()
+    mongo.get_client()
+    mongo.get_async_client()
+    mongo.ensure_indexes()
+    # On by default: until something loads the components, /ready stays 503 and a probe on it never passes
+    if os.getenv("WARMUP_ON_STARTUP", "true").lower() == "true":
+        # Don't hold up startup; /ready reports when everything is loaded
+        threading.Thread(target=warmup.warmup, name="warmup", daemon=True).start()
+    yield
+    await http.aclose_http_client()
+    mongo.close_clients()
+    telemetry.shutdown_tracing()
+
+
+app = FastAPI(title="Gemini FastAPI", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -23,6 +47,23 @@ app.add_middleware(
 def health_check():
     return {"status": "ok", "message": "FastAPI backend is running"}
 
+# Readiness probe: 503 until every lazily loaded component is up (by warmup or by a request) and Mongo answers
+@app.get("/ready")
+def ready():
+    status = warmup.readiness()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+# Preload models and clients in parallel
+@app.post("/warmup")
+async def run_warmup():
+    status = await asyncio.to_thread(warmup.warmup)
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+# Prometheus scrape endpoint: per-stage/tool latency histograms, steps per request, errors, cache stats
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(telemetry.render_metrics(), media_type="text/plain; version=0.0.4")
+
 # Test POST endpoint
 @app.post("/test")
 def test_post(data: dict):
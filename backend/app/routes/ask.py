@@ -1,32 +1,110 @@
-import asyncio
+import json
+import logging
+from typing import Literal
 from fastapi import APIRouter, HTTPException
 from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from app.schema.request import QueryRequest
-from app.agents.react_agent import agent_executor
+from app.agents.react_agent import astream_agent
+from app.helper.memory_function import MemoryFunction
+from app.core.scheduler import AdmissionRejected, RateLimited, get_scheduler
+from app.core.telemetry import stage
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
+
+MEDIA_TYPES = {
+    "text": "text/plain",
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream",
+}
+
+
+def refresh_summary(session_id: str, user_id: str):
+    try:
+        with stage("summary_refresh", session_id=session_id):
+            MemoryFunction(session_id, user_id).refresh_summary()
+    except Exception:
+        logger.exception("Summary refresh failed for session %s", session_id)
+
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """Releases the run's admission ticket however the response ends, including a client disconnect."""
+
+    def __init__(self, content, ticket, **kwargs):
+        super().__init__(content, **kwargs)
+        self.ticket = ticket
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.ticket.release()
+
+
+def encode_event(event: dict, format: str) -> str:
+    if format == "sse":
+        return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+    return json.dumps(event) + "\n"
+
 
 @router.post("/ask/stream")
-async def ask_llm_stream(request: QueryRequest):
+async def ask_llm_stream(request: QueryRequest, format: Literal["text", "ndjson", "sse"] = "text"):
+    """
+    Streams the agent run as it happens.
+    - text (default): only the Final Answer tokens, as plain text
+    - ndjson / sse: every agent event (thought, tool_start, tool_end, token, final)
+    """
+    session_id = request.session_id or "default"
+    inputs = {
+        "input": request.user_input,
+        "session_id": session_id,
+        "user_id": request.user_id or "default_user",
+    }
+
+    # Reject early (429 per-user cap, 503 queue full or wait timed out) instead of queueing without bound
     try:
-        result = agent_executor({
-            "input": request.user_input,
-            "session_id": request.session_id or "default",
-            "user_id": request.user_id or "default_user"
-        })
-
-        # Get the potentially updated session_id
-        final_session_id = result.get("session_id", request.session_id)
-
-        async def token_generator():
-            yield result["output"]
-            await asyncio.sleep(0)
-
-        return StreamingResponse(
-            token_generator(), 
-            media_type="text/plain",
-            headers={"X-Session-Id": final_session_id}
-        )
-
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        ticket = await get_scheduler().admit(inputs["user_id"])
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail, headers={"Retry-After": str(e.retry_after)})
+
+    async def event_generator():
+        emitted = False
+        try:
+            async for event in astream_agent(inputs):
+                if format != "text":
+                    yield encode_event(event, format)
+                elif event["type"] == "token":
+                    emitted = True
+                    yield event["content"]
+                elif event["type"] == "final" and not event["streamed"]:
+                    # The guarded answer differs from what was streamed (or nothing was streamed)
+                    yield ("\n\n" if emitted else "") + event["output"]
+        except RateLimited as e:
+            logger.warning(f"Agent run rate limited: {e}")
+            if format == "text":
+                yield f"Error: {e}"
+            else:
+                yield encode_event({"type": "error", "status": 429, "detail": str(e)}, format)
+        except Exception as e:
+            logger.exception("Agent run failed")
+            if format == "text":
+                yield f"Error: {e}"
+            else:
+                yield encode_event({"type": "error", "status": 500, "detail": str(e)}, format)
+        finally:
+            # As soon as the run ends, rather than after the background summary refresh
+            ticket.release()
+
+    headers = {"X-Session-Id": session_id}
+    if format == "sse":
+        headers.update({"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    return AdmittedStreamingResponse(
+        event_generator(),
+        ticket,
+        media_type=MEDIA_TYPES[format],
+        headers=headers,
+        # Fold new messages into the stored summary once the answer has been sent
+        background=BackgroundTask(refresh_summary, session_id, inputs["user_id"]),
+    )
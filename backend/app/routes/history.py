@@ -1,98 +1,193 @@
-from fastapi import APIRouter, HTTPException
-from pymongo import MongoClient
-import os
+import json
+import base64
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from datetime import datetime
+from bson import ObjectId
+from bson.errors import InvalidId
+from app.db.legacy import LEGACY_PROJECTION, legacy_session_query, numbered_messages
+from app.db.mongo import get_async_database
 
 router = APIRouter()
 
+MESSAGE_TYPES = {"user": "human", "assistant": "ai"}
+
 def get_collection():
-    client = MongoClient(os.getenv("CONNECTIONSTRING"))
-    return client["agent_memory"]["conversations"]
+    return get_async_database()["conversations"]
+
+def get_messages_collection():
+    return get_async_database()["messages"]
+
+SESSION_PAGE_SIZE = 50
+MAX_SESSION_PAGE_SIZE = 200
+
+# Only the header fields
+SESSION_PROJECTION = {"session_id": 1, "user_id": 1, "title": 1, "message_count": 1, "min_seq": 1, "last_updated": 1}
+
+
+def encode_cursor(doc: dict) -> str:
+    last_updated = doc.get("last_updated")
+    payload = {
+        "t": last_updated.isoformat() if isinstance(last_updated, datetime) else None,
+        "id": str(doc["_id"]),
+    }
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> dict:
+    """Keyset filter for the page after cursor, in (last_updated, _id) descending order."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        last_updated = datetime.fromisoformat(payload["t"]) if payload["t"] else None
+        _id = ObjectId(payload["id"])
+    except (ValueError, KeyError, TypeError, InvalidId):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if last_updated is None:
+        # Past the dated sessions: only undated ones (sorted last) remain
+        return {"last_updated": None, "_id": {"$lt": _id}}
+    return {"$or": [
+        {"last_updated": {"$lt": last_updated}},
+        {"last_updated": last_updated, "_id": {"$lt": _id}},
+        {"last_updated": None},
+    ]}
+
 
 @router.get("/sessions")
-async def list_sessions():
-    collection = get_collection()
-    # Fetch all sessions, handle both session_id and SessionId for backward compatibility
-    sessions = list(collection.find({}, {
-        "session_id": 1, 
-        "SessionId": 1,
-        "user_id": 1, 
-        "conversation": 1, 
-        "History": 1,
-        "last_updated": 1
-    }).sort("last_updated", -1))
-    
-    session_list = []
-    for s in sessions:
-        sid = s.get("session_id") or s.get("SessionId") or str(s.get("_id"))
-        user_id = s.get("user_id", "unknown")
-        
-        # Extract title from conversation (new format) or History (old format)
-        title = "New Chat"
-        conv = s.get("conversation", "")
-        if conv:
-            lines = [l for l in conv.split("\n") if l.strip()]
-            if lines:
-                first_line = lines[0]
-                if first_line.startswith("user: "):
-                    title = first_line.replace("user: ", "")[:40]
-                else:
-                    title = first_line[:40]
-        else:
-            # Fallback to old History format if available
-            history = s.get("History", [])
-            if history and isinstance(history, list) and len(history) > 0:
-                first_msg = history[0]
-                if isinstance(first_msg, dict):
-                    title = first_msg.get("content", "New Chat")[:40]
-        
-        session_list.append({
-            "id": sid, 
-            "user_id": user_id,
-            "title": title,
-            "last_updated": s.get("last_updated").isoformat() if isinstance(s.get("last_updated"), datetime) else s.get("last_updated")
-        })
-        
-    return {"sessions": session_list}
+async def list_sessions(
+    user_id: str | None = None,
+    cursor: str | None = None,
+    limit: int = Query(SESSION_PAGE_SIZE, ge=1, le=MAX_SESSION_PAGE_SIZE),
+):
+    """
+    Most recently updated sessions first, one page at a time.
+    Pass next_cursor back as cursor to get the following page; it is null on the last one.
+    """
+    # Legacy documents still waiting for app.db.migrate have no session_id yet
+    filters = [{"session_id": {"$exists": True}}]
+    if user_id:
+        filters.append({"user_id": user_id})
+    if cursor:
+        filters.append(decode_cursor(cursor))
+    query = {"$and": filters} if len(filters) > 1 else filters[0]
+
+    # Served by the (user_id, last_updated, _id) / (last_updated, _id) indexes; one extra row tells us if there's a next page
+    docs = await get_collection().find(query, SESSION_PROJECTION).sort(
+        [("last_updated", -1), ("_id", -1)]
+    ).limit(limit + 1).to_list(None)
+    next_cursor = encode_cursor(docs[limit - 1]) if len(docs) > limit else None
+    docs = docs[:limit]
+
+    sessions = [
+        {
+            "id": d["session_id"],
+            "user_id": d.get("user_id", "unknown"),
+            "title": d.get("title") or "New Chat",
+            # Appended messages count up from 1, migrated legacy ones down from 0
+            "message_count": (d.get("message_count") or 0) - (d.get("min_seq") or 0),
+            "last_updated": d["last_updated"].isoformat() if isinstance(d.get("last_updated"), datetime) else d.get("last_updated"),
+        }
+        for d in docs
+    ]
+    return {"sessions": sessions, "next_cursor": next_cursor}
 
 @router.delete("/sessions/{session_id}")
 async def delete_session(session_id: str):
     collection = get_collection()
-    # Delete by session_id or SessionId
-    collection.delete_many({"$or": [{"session_id": session_id}, {"SessionId": session_id}]})
+    # Along with any legacy documents the migration hasn't reached
+    await collection.delete_many({"$or": [{"session_id": session_id}, {"SessionId": session_id}]})
+    await get_messages_collection().delete_many({"session_id": session_id})
     return {"status": "deleted"}
 
+HISTORY_PAGE_SIZE = 100
+MAX_HISTORY_PAGE_SIZE = 500
+EXPORT_BATCH_SIZE = 500
+
+MESSAGE_PROJECTION = {"_id": 0, "seq": 1, "role": 1, "content": 1}
+
+
+def make_etag(header: dict) -> str:
+    # Every append bumps message_count and last_updated, and migrating legacy messages moves min_seq
+    last_updated = header.get("last_updated")
+    stamp = int(last_updated.timestamp() * 1000) if isinstance(last_updated, datetime) else last_updated
+    return f'W/"{header.get("min_seq", 0)}:{header.get("message_count", 0)}-{stamp}"'
+
+
+async def find_legacy_messages(session_id: str, min_seq: int | None) -> list[dict]:
+    """Messages of legacy documents app.db.migrate hasn't converted yet, with the seqs it will give them."""
+    docs = await get_collection().find(legacy_session_query([session_id]), LEGACY_PROJECTION).sort("_id", 1).to_list(None)
+    return numbered_messages(docs, min_seq) if docs else []
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == "*" or etag in (tag.strip() for tag in if_none_match.split(","))
+
+
 @router.get("/history/{session_id}")
-async def get_chat_history(session_id: str):
-    collection = get_collection()
-    # Find by session_id or SessionId
-    doc = collection.find_one({"$or": [{"session_id": session_id}, {"SessionId": session_id}]})
-    
-    if not doc:
-        return {"history": []}
-    
-    messages = []
-    
-    # Check new format first
-    conv = doc.get("conversation", "")
-    if conv:
-        for line in conv.split("\n"):
-            if line.startswith("user: "):
-                messages.append({"type": "human", "content": line.replace("user: ", "")})
-            elif line.startswith("assistant: "):
-                messages.append({"type": "ai", "content": line.replace("assistant: ", "")})
-    else:
-        # Fallback to old History format
-        history = doc.get("History", [])
-        if history and isinstance(history, list):
-            for msg in history:
-                if isinstance(msg, dict):
-                    # Handle both LangChain message objects and simple dicts
-                    m_type = msg.get("type") or msg.get("role")
-                    content = msg.get("content") or msg.get("text")
-                    if m_type in ["human", "user"]:
-                        messages.append({"type": "human", "content": content})
-                    elif m_type in ["ai", "assistant"]:
-                        messages.append({"type": "ai", "content": content})
-            
-    return {"history": messages}
+async def get_chat_history(
+    session_id: str,
+    request: Request,
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=MAX_HISTORY_PAGE_SIZE),
+    before: int | None = None,
+):
+    """
+    The latest `limit` messages, oldest first. To page further back, pass next_before
+    as before; it is null once the start of the session is reached.
+    Responses carry an ETag; a matching If-None-Match gets a 304 without reading any messages.
+    """
+    header = await get_collection().find_one(
+        {"session_id": session_id},
+        {"_id": 0, "message_count": 1, "min_seq": 1, "last_updated": 1},
+    )
+    headers = {"Cache-Control": "private, no-cache"}
+    if header:
+        headers["ETag"] = make_etag(header)
+        if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+            return Response(status_code=304, headers=headers)
+
+    query = {"session_id": session_id}
+    if before is not None:
+        query["seq"] = {"$lt": before}
+    docs = await get_messages_collection().find(query, MESSAGE_PROJECTION).sort("seq", -1).limit(limit + 1).to_list(None)
+    if len(docs) <= limit:
+        # Reached the oldest stored message; unmigrated legacy ones come before it
+        legacy = await find_legacy_messages(session_id, (header or {}).get("min_seq"))
+        docs += [m for m in reversed(legacy) if before is None or m["seq"] < before][:limit + 1 - len(docs)]
+    page = docs[:limit][::-1]
+    messages = [
+        {"type": MESSAGE_TYPES[m["role"]], "content": m["content"], "seq": m["seq"]}
+        for m in page
+        if m["role"] in MESSAGE_TYPES
+    ]
+    next_before = page[0]["seq"] if len(docs) > limit else None
+    return JSONResponse({"history": messages, "next_before": next_before}, headers=headers)
+
+
+@router.get("/history/{session_id}/export")
+async def export_chat_history(session_id: str):
+    """The full session as NDJSON, one message per line, streamed in seq order."""
+
+    async def lines():
+        header = await get_collection().find_one({"session_id": session_id}, {"min_seq": 1}) or {}
+        for m in await find_legacy_messages(session_id, header.get("min_seq")):
+            yield json.dumps({**m, "created_at": None}) + "\n"
+
+        cursor = get_messages_collection().find(
+            {"session_id": session_id},
+            {"_id": 0, "seq": 1, "role": 1, "content": 1, "created_at": 1},
+        ).sort("seq", 1).batch_size(EXPORT_BATCH_SIZE)
+        async for m in cursor:
+            created_at = m.get("created_at")
+            yield json.dumps({
+                "seq": m["seq"],
+                "role": m["role"],
+                "content": m["content"],
+                "created_at": created_at.isoformat() if isinstance(created_at, datetime) else created_at,
+            }) + "\n"
+
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{session_id}.ndjson"'},
+    )
@@ -1,10 +1,10 @@
 import json
 import logging
-import requests
 from langchain_core.tools import tool
+from app.core.http import HTTP_MAX_RESPONSE_BYTES, fetch_text
 
 @tool
-def api_agent(endpoint: str | dict, params: dict = {}) -> str:
+async def api_agent(endpoint: str | dict, params: dict = {}) -> str:
     """
     Calls an external API and returns the response.
     Accepts either:
@@ -23,9 +23,10 @@ def api_agent(endpoint: str | dict, params: dict = {}) -> str:
             endpoint = payload.get("endpoint")
             params = payload.get("params", {})
 
-        response = requests.get(endpoint, params=params, timeout=10)
-        response.raise_for_status()
-        return response.text
+        text, truncated = await fetch_text(endpoint, params=params)
+        if truncated:
+            text += f"\n... [response truncated at {HTTP_MAX_RESPONSE_BYTES} bytes]"
+        return text
 
     except Exception as e:
         logging.error(f"API call failed: {e}")
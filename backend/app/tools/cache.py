@@ -0,0 +1,130 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from collections import Counter
+from app.helper.cache import BoundedCache
+
+logger = logging.getLogger(__name__)
+
+# "memory" (per process) or "redis" (shared across workers)
+TOOL_CACHE_BACKEND = os.getenv("TOOL_CACHE_BACKEND", "memory").lower()
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+# Tools not listed here are never cached: current_time and joke_generator are
+# volatile by design, save_user_profile has side effects.
+# normalize_whitespace collapses whitespace in string inputs; only safe where it never
+# changes meaning (queries, endpoints), not for code, where indentation is significant.
+TOOL_CACHE_POLICIES = {
+    "rag_search": {"ttl": 3600, "maxsize": 512, "normalize_whitespace": True},
+    "api_agent": {"ttl": 60, "maxsize": 256, "normalize_whitespace": True},
+    "python_expert": {"ttl": 86400, "maxsize": 256},
+    "tavily_search": {"ttl": 600, "maxsize": 256, "normalize_whitespace": True},
+    "solve_math": {"ttl": 86400, "maxsize": 1024},
+}
+
+# Failed calls come back as strings from some tools; never serve those from cache
+UNCACHEABLE_PREFIXES = ("API call failed", "Tool error")
+
+
+def _normalize(value, whitespace: bool):
+    if isinstance(value, str):
+        return " ".join(value.split()) if whitespace else value
+    if isinstance(value, dict):
+        # {"endpoint": x} and {"endpoint": x, "params": {}} are the same call
+        return {k: _normalize(v, whitespace) for k, v in value.items() if v not in (None, "", {}, [])}
+    if isinstance(value, list):
+        return [_normalize(v, whitespace) for v in value]
+    return value
+
+
+def cache_key(tool_input, normalize_whitespace: bool = False) -> str:
+    payload = json.dumps(_normalize(tool_input, normalize_whitespace), sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# ---------- Backends ----------
+
+class MemoryBackend:
+    def __init__(self, policies: dict):
+        self.caches = {name: BoundedCache(p["maxsize"], ttl=p["ttl"]) for name, p in policies.items()}
+
+    async def get(self, tool_name: str, key: str):
+        return self.caches[tool_name].get(key)
+
+    async def set(self, tool_name: str, key: str, value: str, ttl: float):
+        self.caches[tool_name].set(key, value)
+
+
+class RedisBackend:
+    """Shared across workers. Size is bounded by Redis' own maxmemory/eviction policy, not maxsize."""
+
+    def __init__(self, url: str):
+        import redis.asyncio as redis
+
+        self.client = redis.from_url(url, decode_responses=True)
+
+    async def get(self, tool_name: str, key: str):
+        return await self.client.get(f"toolcache:{tool_name}:{key}")
+
+    async def set(self, tool_name: str, key: str, value: str, ttl: float):
+        await self.client.set(f"toolcache:{tool_name}:{key}", value, ex=int(ttl))
+
+
+# ---------- Cache ----------
+
+class ToolCache:
+    """Memoizes tool calls by normalized input, with a TTL and size limit per tool."""
+
+    def __init__(self, backend, policies: dict = TOOL_CACHE_POLICIES):
+        self.backend = backend
+        self.policies = policies
+        self.hits = Counter()
+        self.misses = Counter()
+
+    async def arun(self, tool_name: str, tool, tool_input):
+        policy = self.policies.get(tool_name)
+        if policy is None:
+            return await tool.arun(tool_input)
+
+        key = cache_key(tool_input, policy.get("normalize_whitespace", False))
+        try:
+            cached = await self.backend.get(tool_name, key)
+        except Exception as e:
+            logger.warning(f"Tool cache read failed: {e}")
+            cached = None
+
+        if cached is not None:
+            self.hits[tool_name] += 1
+            return cached
+
+        self.misses[tool_name] += 1
+        result = await tool.arun(tool_input)
+
+        if isinstance(result, str) and not result.startswith(UNCACHEABLE_PREFIXES):
+            try:
+                await self.backend.set(tool_name, key, result, policy["ttl"])
+            except Exception as e:
+                logger.warning(f"Tool cache write failed: {e}")
+        return result
+
+    def stats(self) -> dict:
+        return {
+            name: {"hits": self.hits[name], "misses": self.misses[name]}
+            for name in self.policies
+        }
+
+
+_tool_cache: ToolCache | None = None
+_lock = threading.Lock()
+
+
+def get_tool_cache() -> ToolCache:
+    global _tool_cache
+    if _tool_cache is None:
+        with _lock:
+            if _tool_cache is None:
+                backend = RedisBackend(REDIS_URL) if TOOL_CACHE_BACKEND == "redis" else MemoryBackend(TOOL_CACHE_POLICIES)
+                _tool_cache = ToolCache(backend)
+    return _tool_cache
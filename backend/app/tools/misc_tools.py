@@ -1,16 +1,15 @@
+import json
 import logging
-import requests
 from langchain_core.tools import tool
 from datetime import datetime
+from app.core.http import fetch_text
 
 @tool
-def joke_generator(message: str = "") -> str:
+async def joke_generator(message: str = "") -> str:
     """Fetch a random joke from the official joke API"""
     logging.info("joke_generator tool CALLED")
-    response = requests.get(
-        "https://official-joke-api.appspot.com/random_joke", timeout=10
-    )
-    data = response.json()
+    text, _ = await fetch_text("https://official-joke-api.appspot.com/random_joke")
+    data = json.loads(text)
     return f"{data['setup']} ... {data['punchline']}"
 
 @tool
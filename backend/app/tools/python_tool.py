@@ -1,10 +1,10 @@
 import logging
 from langchain_core.prompts import PromptTemplate
 from langchain_core.tools import tool
-from app.core.llm import llm
+from app.core.llm import get_llm
 
 @tool
-def python_expert(user_input: str) -> str:
+async def python_expert(user_input: str) -> str:
     """Provides Python expertise, debugging, and best practices."""
     logging.info("🐍 python_expert tool CALLED")
 
@@ -24,5 +24,5 @@ User input:
 """
     )
 
-    response = llm.invoke(prompt.format(user_input=user_input))
+    response = await get_llm().ainvoke(prompt.format(user_input=user_input))
     return response.content
@@ -1,26 +1,34 @@
 from langchain_core.tools import Tool
 from pathlib import Path
 import logging
-from app.vector.vectorstore import get_vectorstore
+from app.vector.catalog import format_record, get_catalog
+from app.vector.vectorstore import hybrid_search
 
 logger = logging.getLogger(__name__)
 
 DOCS_PATH = Path(__file__).parent.parent / "vector" / "docs.txt"
-HTTP_METHODS = ["GET", "POST", "PUT", "DELETE", "PATCH"]
 
 
 def rag_search_impl(query: str, k: int = 3) -> str:
     """
-    Search API documentation using vector search.
-    Falls back to docs.txt if vector search fails.
+    Search API documentation.
+    Returns compact endpoint records from the precomputed catalog when they match,
+    otherwise hybrid (vector + BM25) search over the docs, falling back to docs.txt.
     """
 
+    # ------------------ endpoint catalog ------------------ 
+    try:
+        records = get_catalog().search(query, k=k)
+        if records:
+            return "API Endpoints:\n\n" + "\n\n".join(format_record(r) for r in records)
+    except Exception as e:
+        logger.warning(f"Endpoint catalog lookup failed: {e}")
+
     docs_text = ""
 
-    # ------------------ vector search ------------------ 
+    # ------------------ hybrid search ------------------ 
     try:
-        vectorstore = get_vectorstore()
-        docs = vectorstore.similarity_search(query, k=k)
+        docs = hybrid_search(query, k=k)
         if docs:
             docs_text = "\n".join(doc.page_content for doc in docs)
     except Exception as e:
@@ -31,37 +39,7 @@ def rag_search_impl(query: str, k: int = 3) -> str:
             return "No API documentation found."
         docs_text = DOCS_PATH.read_text(encoding="utf-8")
 
-    # ------------------  Extract simple API details ------------------ 
-    base_url = ""
-    method = ""
-    endpoint = ""
-
-    for line in docs_text.splitlines():
-        line = line.strip()
-
-        if line.lower().startswith("base url:"):
-            base_url = line.split(":", 1)[1].strip()
-
-        if line.lower().startswith("endpoint:"):
-            endpoint = line.split(":", 1)[1].strip()
-
-        for http_method in HTTP_METHODS:
-            if http_method in line.upper():
-                method = http_method
-
-    # ---------------- Build response ------------------ 
-    result = f"API Documentation:\n\n{docs_text}\n"
-
-    if endpoint:
-        result += (
-            "\nExtracted API Details:\n"
-            f"Method: {method}\n"
-            f"Endpoint: {endpoint}\n"
-            f"Base URL: {base_url}\n"
-            f"Full URL: {base_url}{endpoint}\n"
-        )
-
-    return result
+    return f"API Documentation:\n\n{docs_text}\n"
 
 
 rag_search = Tool(
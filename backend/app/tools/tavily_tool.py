@@ -1,9 +1,18 @@
 import os
 import logging
-from tavily import TavilyClient
 from langchain_core.tools import tool
 
-tavily_client = TavilyClient(api_key=os.getenv("TAVILY_API_KEY"))
+_tavily_client = None
+
+
+def get_tavily_client():
+    global _tavily_client
+    if _tavily_client is None:
+        from tavily import TavilyClient
+
+        _tavily_client = TavilyClient(api_key=os.getenv("TAVILY_API_KEY"))
+    return _tavily_client
+
 
 @tool
 def tavily_search(query: str) -> str:
@@ -13,7 +22,7 @@ def tavily_search(query: str) -> str:
    """
     logging.info("🔍 tavily_search tool CALLED")
 
-    response = tavily_client.search(
+    response = get_tavily_client().search(
         query=query,
         search_depth="basic",
         max_results=5
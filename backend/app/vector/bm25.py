@@ -0,0 +1,61 @@
+import math
+import re
+from collections import Counter, defaultdict
+
+WORD_RE = re.compile(r"[a-z0-9]+")
+# Keep whole URL paths as tokens too, so "/posts/1/comments" matches exactly
+PATH_RE = re.compile(r"/[a-z0-9_{}:.\-/]+")
+
+
+def tokenize(text: str) -> list[str]:
+    text = text.lower()
+    return WORD_RE.findall(text) + [p.rstrip("/.") for p in PATH_RE.findall(text)]
+
+
+class BM25Index:
+    """In-process Okapi BM25 over the chunks of the Chroma collection."""
+
+    def __init__(self, ids: list[str], texts: list[str], metadatas: list[dict], k1: float = 1.5, b: float = 0.75):
+        self.ids = ids
+        self.texts = texts
+        self.metadatas = metadatas
+        self.k1 = k1
+        self.b = b
+
+        self.term_freqs = [Counter(tokenize(text)) for text in texts]
+        self.lengths = [sum(tf.values()) for tf in self.term_freqs]
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+
+        # term -> list of doc positions containing it
+        self.postings = defaultdict(list)
+        for i, tf in enumerate(self.term_freqs):
+            for term in tf:
+                self.postings[term].append(i)
+
+        n = len(texts)
+        self.idf = {
+            term: math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in self.postings.items()
+        }
+
+    def search(self, query: str, k: int) -> list[tuple[int, float]]:
+        """Top-k (position, score) pairs; positions index into ids/texts/metadatas."""
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for i in self.postings[term]:
+                tf = self.term_freqs[i][term]
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[i] / self.avg_length)
+                scores[i] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+
+def reciprocal_rank_fusion(rankings: list[list[str]], k: int = 60) -> list[str]:
+    """Merge ranked ID lists; each list contributes 1 / (k + rank) per ID."""
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] += 1 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
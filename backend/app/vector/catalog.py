@@ -0,0 +1,268 @@
+import hashlib
+import json
+import logging
+import re
+import threading
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+from app.vector.bm25 import WORD_RE, BM25Index
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).parent
+CATALOG_PATH = BASE_DIR / "api_catalog.json"
+# Written after the catalog by ingestion, so servers notice a new catalog and reload it
+CATALOG_VERSION_PATH = BASE_DIR / "api_catalog.version"
+DOCS_PATH = BASE_DIR / "docs.txt"
+
+HTTP_METHODS = {"GET", "POST", "PUT", "DELETE", "PATCH"}
+
+FETCH_RE = re.compile(r"fetch\(\s*['\"`](?P<url>https?://[^'\"`]+)['\"`]")
+METHOD_RE = re.compile(r"method:\s*['\"](?P<method>[A-Za-z]+)['\"]")
+BODY_RE = re.compile(r"JSON\.stringify\(\{(?P<body>.*?)\}\)", re.S)
+BODY_KEY_RE = re.compile(r"^\s*['\"]?(\w+)['\"]?\s*:", re.M)
+KEY_VALUE_RE = re.compile(r"^(base url|endpoint|method)\s*:\s*(.+)$", re.I)
+BARE_PATH_RE = re.compile(r"^/[\w{}:.\-/]+$")
+OBJECT_KEY_RE = re.compile(r"^['\"]?[\w-]+['\"]?\s*:")
+NUMERIC_SEGMENT_RE = re.compile(r"/\d+(?=/|$)")
+PARAM_SEGMENT_RE = re.compile(r"^(\d+|\{.*\}|:.*)$")
+METHOD_TOKEN_RE = re.compile(r"\b(GET|POST|PUT|PATCH|DELETE)\b")
+
+# Actions a question can ask for, by the methods that perform them.
+# "post" is left out: it is far more often the resource than the verb.
+VERB_METHODS = {
+    **dict.fromkeys(("get", "list", "fetch", "show", "read", "retrieve", "find", "view", "search"), {"GET"}),
+    **dict.fromkeys(("create", "add", "make", "submit", "new"), {"POST"}),
+    **dict.fromkeys(("update", "edit", "modify", "change", "replace", "put", "patch"), {"PUT", "PATCH"}),
+    **dict.fromkeys(("delete", "remove", "destroy", "erase"), {"DELETE"}),
+}
+
+
+# ------------------ Extraction (runs at ingestion) ------------------
+
+def normalize_path(path: str) -> str:
+    """/posts/1/comments and /posts/{id}/comments look up the same endpoint."""
+    return NUMERIC_SEGMENT_RE.sub("/{id}", path.lower().rstrip("/")) or "/"
+
+
+def _singular(term: str) -> str:
+    return term[:-1] if len(term) > 3 and term.endswith("s") else term
+
+
+def resource_of(path: str) -> str:
+    """The resource an endpoint serves: its last non-parameter path segment (/users/1/todos -> todo)."""
+    segments = [s for s in path.lower().split("/") if s and not PARAM_SEGMENT_RE.match(s)]
+    return _singular(segments[-1]) if segments else ""
+
+
+def requested_methods(query: str) -> set[str]:
+    """HTTP methods the query asks for, by name ("PUT") or by verb ("updating" -> PUT/PATCH)."""
+    methods = set(METHOD_TOKEN_RE.findall(query))
+    for word in WORD_RE.findall(query.lower()):
+        # update, updates, updated, updating, adding
+        for form in (word, word[:-1], word[:-2], word[:-3] + "e", word[:-3]):
+            if form in VERB_METHODS:
+                methods |= VERB_METHODS[form]
+                break
+    return methods
+
+
+def _is_prose(line: str) -> bool:
+    if line.startswith("//"):
+        return True
+    return (
+        line[:1].isalpha()
+        and not OBJECT_KEY_RE.match(line)
+        and not line.startswith(("fetch", "Important:"))
+    )
+
+
+def _call_text(lines: list[str], start: int) -> str:
+    """The source of one fetch(...) call: up to its .then() chain or closing ');'."""
+    call = []
+    for line in lines[start:start + 30]:
+        call.append(line)
+        if ".then(" in line or line.strip().endswith(");"):
+            break
+    return "\n".join(call)
+
+
+def extract_endpoints(text: str, source: str = "") -> list[dict]:
+    """
+    Pull endpoint records out of API docs written either as fetch() examples,
+    as "Base URL: / Method: / Endpoint:" lines, or as bare path lists.
+    """
+    records = {}
+    lines = text.splitlines()
+    base_url = ""
+    block_method = ""
+    description = ""
+
+    def add(method, path, params):
+        key = (method, base_url, path)
+        record = records.setdefault(key, {
+            "method": method,
+            "path": path,
+            "base_url": base_url,
+            "url": f"{base_url}{path}",
+            "parameters": [],
+            "description": description,
+            "source": source,
+        })
+        record["parameters"] += [p for p in params if p not in record["parameters"]]
+
+    for i, raw in enumerate(lines):
+        line = raw.strip()
+        if not line:
+            block_method = ""
+            continue
+
+        fetch = FETCH_RE.search(line)
+        if fetch:
+            call = _call_text(lines, i)
+            url = urlsplit(fetch["url"])
+            base_url = f"{url.scheme}://{url.netloc}"
+            method = METHOD_RE.search(call)
+            params = [f"{name} (query)" for name in parse_qs(url.query)]
+            body = BODY_RE.search(call)
+            if body:
+                params += [f"{name} (body)" for name in BODY_KEY_RE.findall(body["body"])]
+            add(method["method"].upper() if method else "GET", url.path or "/", params)
+            continue
+
+        key_value = KEY_VALUE_RE.match(line)
+        if key_value:
+            key, value = key_value[1].lower(), key_value[2].strip()
+            if key == "base url":
+                base_url = value.rstrip("/")
+            elif key == "method" and value.upper() in HTTP_METHODS:
+                block_method = value.upper()
+            elif key == "endpoint":
+                parts = value.split()
+                if parts[0].upper() in HTTP_METHODS and len(parts) > 1:
+                    block_method, value = parts[0].upper(), parts[1]
+                add(block_method or "GET", value, [])
+            continue
+
+        if BARE_PATH_RE.match(line) and base_url:
+            add("GET", line, [])
+            continue
+
+        if _is_prose(line):
+            description = line.lstrip("/ ").strip()
+
+    return list(records.values())
+
+
+def format_record(record: dict) -> str:
+    lines = [
+        f"Method: {record['method']}",
+        f"Endpoint: {record['path']}",
+        f"Base URL: {record['base_url']}",
+        f"Full URL: {record['url']}",
+    ]
+    if record["parameters"]:
+        lines.append(f"Parameters: {', '.join(record['parameters'])}")
+    if record["description"]:
+        lines.append(f"Description: {record['description']}")
+    return "\n".join(lines)
+
+
+def _write_atomic(path: Path, text: str):
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(text, encoding="utf-8")
+    tmp.replace(path)
+
+
+def save_catalog(records: list[dict], path: Path = CATALOG_PATH):
+    text = json.dumps(records, indent=2)
+    _write_atomic(path, text)
+    if path == CATALOG_PATH:
+        _write_atomic(CATALOG_VERSION_PATH, hashlib.sha256(text.encode("utf-8")).hexdigest())
+
+
+# ------------------ In-memory index (used per query) ------------------
+
+class EndpointCatalog:
+    def __init__(self, records: list[dict]):
+        self.records = records
+        self.by_path = {}
+        for i, record in enumerate(records):
+            self.by_path.setdefault(normalize_path(record["path"]), []).append(i)
+        self.index = BM25Index(
+            [str(i) for i in range(len(records))],
+            [
+                f"{r['method']} {r['path']} {r['url']} {r['description']} {' '.join(r['parameters'])}"
+                for r in records
+            ],
+            [{} for _ in records],
+        )
+        self.resources = [resource_of(r["path"]) for r in records]
+
+    def lookup_path(self, path: str) -> list[dict]:
+        return [self.records[i] for i in self.by_path.get(normalize_path(path), [])]
+
+    def search(self, query: str, k: int = 3) -> list[dict]:
+        """
+        Exact path/URL matches first, then keyword (BM25) matches whose resource the query
+        names. Words shared only with descriptions ("how", "new") don't count, and when the
+        query asks for an action ("update a post") only endpoints with a matching method
+        do, so a question no endpoint covers returns nothing and the caller falls back to
+        document search.
+        """
+        positions = []
+        for token in query.split():
+            token = token.strip("'\"`,;()<>")
+            if token.startswith(("http://", "https://")):
+                token = urlsplit(token).path
+            if token.startswith("/"):
+                positions += self.by_path.get(normalize_path(token.split("?")[0]), [])
+
+        named = {_singular(term) for term in WORD_RE.findall(query.lower())}
+        positions += [i for i, _ in self.index.search(query, len(self.records)) if self.resources[i] in named]
+        methods = requested_methods(query)
+        if methods:
+            positions = [i for i in positions if self.records[i]["method"] in methods]
+        unique = list(dict.fromkeys(positions))
+        return [self.records[i] for i in unique[:k]]
+
+
+_catalog: EndpointCatalog | None = None
+_catalog_version = None
+_lock = threading.Lock()
+
+
+def _catalog_file_version() -> str | None:
+    try:
+        return CATALOG_VERSION_PATH.read_text(encoding="utf-8")
+    except FileNotFoundError:
+        return None
+
+
+def get_catalog() -> EndpointCatalog:
+    """
+    Loaded from the file written by ingestion (or extracted from docs.txt if absent), and
+    reloaded when ingestion (usually another process) has written a new one since.
+    """
+    global _catalog, _catalog_version
+    version = _catalog_file_version()
+    if _catalog is None or version != _catalog_version:
+        with _lock:
+            if _catalog is None or version != _catalog_version:
+                if CATALOG_PATH.exists():
+                    records = json.loads(CATALOG_PATH.read_text(encoding="utf-8"))
+                elif DOCS_PATH.exists():
+                    logger.info("No %s yet; extracting endpoints from %s", CATALOG_PATH.name, DOCS_PATH.name)
+                    records = extract_endpoints(DOCS_PATH.read_text(encoding="utf-8"), DOCS_PATH.name)
+                else:
+                    records = []
+                _catalog = EndpointCatalog(records)
+                _catalog_version = version
+    return _catalog
+
+
+def reset_catalog():
+    global _catalog
+    with _lock:
+        _catalog = None
@@ -0,0 +1,144 @@
+"""
+Incremental ingestion of the RAG docs directory into Chroma.
+
+    python -m app.vector.ingest [--docs-dir DIR] [--dry-run]
+
+Chunk IDs are content hashes, so re-running only embeds chunks that are new or
+changed and deletes chunks whose source text is gone; unchanged chunks are untouched.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from app.vector.catalog import extract_endpoints, reset_catalog, save_catalog
+from app.vector.vectorstore import BASE_DIR, CHROMA_DIR, get_vectorstore, load_pdf, load_text, reset_bm25_index, write_corpus_version
+
+logger = logging.getLogger(__name__)
+
+DOCS_DIR = Path(os.getenv("DOCS_DIR", str(BASE_DIR)))
+LOADERS = {".txt": load_text, ".md": load_text, ".pdf": load_pdf}
+
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+DELETE_BATCH_SIZE = 500
+
+
+def chunk_id(source: str, content: str) -> str:
+    return hashlib.sha256(f"{source}\0{content}".encode("utf-8")).hexdigest()
+
+
+def _clean_metadata(metadata: dict) -> dict:
+    # Chroma only stores scalar metadata values
+    return {k: v for k, v in metadata.items() if isinstance(v, (str, int, float, bool))}
+
+
+def doc_files(docs_dir: Path) -> list[Path]:
+    return [
+        path for path in sorted(docs_dir.rglob("*"))
+        if path.suffix.lower() in LOADERS and path.is_file() and CHROMA_DIR not in path.parents
+    ]
+
+
+def read_text(path: Path) -> str:
+    if path.suffix.lower() == ".pdf":
+        from langchain_community.document_loaders import PyPDFLoader
+
+        return "\n".join(page.page_content for page in PyPDFLoader(str(path)).load())
+    return path.read_text(encoding="utf-8")
+
+
+def build_catalog(docs_dir: Path) -> list[dict]:
+    """Structured endpoint records, extracted once here instead of on every rag_search call."""
+    records = []
+    for path in doc_files(docs_dir):
+        records += extract_endpoints(read_text(path), str(path.relative_to(docs_dir)))
+    return records
+
+
+def load_chunks(docs_dir: Path) -> dict:
+    """Chunk every supported file under docs_dir; returns {chunk_id: Document}."""
+    chunks = {}
+    for path in doc_files(docs_dir):
+        source = str(path.relative_to(docs_dir))
+        for doc in LOADERS[path.suffix.lower()](str(path)):
+            doc.metadata = _clean_metadata({**doc.metadata, "source": source})
+            chunks.setdefault(chunk_id(source, doc.page_content), doc)
+    return chunks
+
+
+def _batches(items: list, size: int):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def ingest(docs_dir: Path = DOCS_DIR, dry_run: bool = False) -> dict:
+    start = time.perf_counter()
+    chunks = load_chunks(docs_dir)
+
+    if dry_run and not CHROMA_DIR.exists():
+        # Nothing to compare against, and a dry run must not create the index
+        store, existing = None, set()
+    else:
+        # Opening an empty directory creates the collection
+        CHROMA_DIR.mkdir(parents=True, exist_ok=True)
+        store = get_vectorstore()
+        existing = set(store.get(include=[])["ids"])
+
+    to_add = [cid for cid in chunks if cid not in existing]
+    stale = [cid for cid in existing if cid not in chunks]
+    report = {
+        "files": len({doc.metadata["source"] for doc in chunks.values()}),
+        "chunks": len(chunks),
+        "added": len(to_add),
+        "deleted": len(stale),
+        "unchanged": len(chunks) - len(to_add),
+    }
+    catalog = build_catalog(docs_dir)
+    report["endpoints"] = len(catalog)
+    if dry_run:
+        return report
+
+    save_catalog(catalog)
+    reset_catalog()
+
+    if to_add:
+        def add(batch):
+            return store.add_texts(
+                [chunks[cid].page_content for cid in batch],
+                metadatas=[chunks[cid].metadata for cid in batch],
+                ids=batch,
+            )
+
+        # Batches are embedded and written concurrently
+        with ThreadPoolExecutor(max_workers=EMBED_CONCURRENCY, thread_name_prefix="embed") as pool:
+            list(pool.map(add, _batches(to_add, EMBED_BATCH_SIZE)))
+
+    # Only once every new chunk is stored, so a failed embed never leaves documents missing
+    for batch in _batches(stale, DELETE_BATCH_SIZE):
+        store.delete(ids=batch)
+
+    # Unchanged corpora keep their fingerprint, so servers only rebuild BM25 after real changes
+    write_corpus_version(chunks)
+    if to_add or stale:
+        reset_bm25_index()
+
+    report["seconds"] = round(time.perf_counter() - start, 2)
+    logger.info("Ingestion finished: %s", report)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs-dir", type=Path, default=DOCS_DIR)
+    parser.add_argument("--dry-run", action="store_true", help="report what would change without embedding")
+    args = parser.parse_args()
+    print(json.dumps(ingest(args.docs_dir, dry_run=args.dry_run), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,17 @@
-from uuid import uuid4
 from pathlib import Path
 import os
+import hashlib
 import logging
+import threading
 
 from dotenv import load_dotenv
-from langchain_openai import AzureOpenAIEmbeddings
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_chroma import Chroma
-from langchain_community.document_loaders import TextLoader, PyPDFLoader
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from app.helper.cache import BoundedCache
+from app.vector.bm25 import BM25Index, reciprocal_rank_fusion
+
+# LangChain/Chroma integrations are imported inside the functions that need them,
+# so importing the app (and the rag tool) stays cheap until RAG is actually used.
 
 load_dotenv()
 logging.basicConfig(level=logging.INFO)
@@ -16,10 +20,45 @@ logger = logging.getLogger(__name__)
 BASE_DIR = Path(__file__).parent
 DOCS_PATH = BASE_DIR / "docs.txt"
 CHROMA_DIR = BASE_DIR / "chroma_db"
+# Written by ingestion; a server rebuilds its BM25 index when this changes
+CORPUS_VERSION_PATH = CHROMA_DIR / "corpus_version"
+
+# "azure" (remote) or "local" (sentence-transformers on CPU). Each backend has its own
+# collection because the vector dimensions differ; run ingestion after switching.
+EMBEDDINGS_BACKEND = os.getenv("EMBEDDINGS_BACKEND", "azure").lower()
+LOCAL_EMBEDDING_MODEL = os.getenv("LOCAL_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+COLLECTION_NAME = "docs" if EMBEDDINGS_BACKEND == "azure" else f"docs_{EMBEDDINGS_BACKEND}"
+
+# Hybrid retrieval: candidates taken from each retriever before reciprocal-rank fusion
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "10"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024"))
+QUERY_EMBEDDING_CACHE_TTL = float(os.getenv("QUERY_EMBEDDING_CACHE_TTL", "86400"))
 
 # ------------------ Embeddings ------------------
 
+class LocalEmbeddings(Embeddings):
+    """sentence-transformers model running in-process; no network round trip per query."""
+
+    def __init__(self, model_name: str = LOCAL_EMBEDDING_MODEL):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_name, device="cpu")
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.model.encode(texts, batch_size=32, normalize_embeddings=True).tolist()
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.model.encode(text, normalize_embeddings=True).tolist()
+
+
 def get_embeddings():
+    if EMBEDDINGS_BACKEND == "local":
+        return LocalEmbeddings()
+
+    from langchain_openai import AzureOpenAIEmbeddings
+
     return AzureOpenAIEmbeddings(
         api_key=os.environ["AZURE_OPENAI_API_KEY"],
         azure_endpoint=os.environ["EMBEDDING_ENDPOINT"],
@@ -27,41 +66,164 @@ def get_embeddings():
         # api_version=os.environ["EMBEDDING_VERSION"],
     )
 
+
+def normalize_query(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """Wraps an embeddings client so repeated queries skip the remote round trip."""
+
+    def __init__(self, embeddings: Embeddings, cache: BoundedCache):
+        self.embeddings = embeddings
+        self.cache = cache
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        query = normalize_query(text)
+        vector = self.cache.get(query)
+        if vector is None:
+            vector = self.embeddings.embed_query(query)
+            self.cache.set(query, vector)
+        return vector
+
+
+query_embedding_cache = BoundedCache(QUERY_EMBEDDING_CACHE_SIZE, ttl=QUERY_EMBEDDING_CACHE_TTL)
+_query_embeddings = None
+
+
+def get_query_embeddings() -> CachedQueryEmbeddings:
+    """Process-wide embeddings client, shared by the vector store and the semantic answer cache."""
+    global _query_embeddings
+    if _query_embeddings is None:
+        _query_embeddings = CachedQueryEmbeddings(get_embeddings(), query_embedding_cache)
+    return _query_embeddings
+
 # ------------------ Load & Chunk ------------------
 
 def load_text(path: str):
+    from langchain_community.document_loaders import TextLoader
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
     loader = TextLoader(path, encoding="utf-8")
     docs = loader.load()
     splitter = RecursiveCharacterTextSplitter(chunk_size=600, chunk_overlap=100)
     return splitter.split_documents(docs)
 
 def load_pdf(path: str):
+    from langchain_community.document_loaders import PyPDFLoader
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
     loader = PyPDFLoader(path)
     docs = loader.load()
     splitter = RecursiveCharacterTextSplitter(chunk_size=600, chunk_overlap=100)
     return splitter.split_documents(docs)
 
 # ------------------ Vector Store ------------------
+# One handle per process. Requests only ever open an existing index;
+# building it happens offline (python -m app.vector.ingest) or during warmup.
 
-def get_vectorstore():
-    embeddings = get_embeddings()
-
-    if CHROMA_DIR.exists():
-        logger.info("Loading existing Chroma DB")
-        return Chroma(
-            persist_directory=str(CHROMA_DIR),
-            collection_name="docs",
-            embedding_function=embeddings,
-        )
-
-    logger.info("Creating new Chroma DB")
-    chunks = load_text(str(DOCS_PATH))
-    ids = [str(uuid4()) for _ in chunks]
-
-    return Chroma.from_documents(
-        documents=chunks,
-        ids=ids,
-        embedding=embeddings,
+_vectorstore = None
+_bm25_index = None
+_bm25_version = None
+_lock = threading.Lock()
+
+
+def _open_vectorstore():
+    from langchain_chroma import Chroma
+
+    return Chroma(
         persist_directory=str(CHROMA_DIR),
-        collection_name="docs",
+        collection_name=COLLECTION_NAME,
+        embedding_function=get_query_embeddings(),
     )
+
+
+def get_vectorstore():
+    global _vectorstore
+    if _vectorstore is None:
+        with _lock:
+            if _vectorstore is None:
+                if not CHROMA_DIR.exists():
+                    raise FileNotFoundError(
+                        f"No vector index at {CHROMA_DIR}; build it with `python -m app.vector.ingest`"
+                    )
+                logger.info("Loading existing Chroma DB")
+                _vectorstore = _open_vectorstore()
+    return _vectorstore
+
+
+def corpus_fingerprint(ids) -> str:
+    return hashlib.sha256("\n".join(sorted(ids)).encode("utf-8")).hexdigest()
+
+
+def write_corpus_version(ids):
+    tmp = CORPUS_VERSION_PATH.with_suffix(".tmp")
+    tmp.write_text(corpus_fingerprint(ids), encoding="utf-8")
+    tmp.replace(CORPUS_VERSION_PATH)
+
+
+def _corpus_version() -> str | None:
+    try:
+        return CORPUS_VERSION_PATH.read_text(encoding="utf-8")
+    except FileNotFoundError:
+        return None
+
+
+def get_bm25_index() -> BM25Index:
+    """
+    Lexical index over the same chunks as the Chroma collection, built on first use and
+    rebuilt when ingestion (usually another process) has changed the collection since.
+    """
+    global _bm25_index, _bm25_version
+    version = _corpus_version()
+    if _bm25_index is None or version != _bm25_version:
+        data = get_vectorstore().get(include=["documents", "metadatas"])
+        with _lock:
+            _bm25_index = BM25Index(data["ids"], data["documents"], data["metadatas"])
+            _bm25_version = version
+    return _bm25_index
+
+
+def reset_bm25_index():
+    global _bm25_index
+    with _lock:
+        _bm25_index = None
+
+
+def hybrid_search(query: str, k: int = 3) -> list[Document]:
+    """Dense + BM25 retrieval merged with reciprocal-rank fusion."""
+    dense = get_vectorstore().similarity_search(query, k=RETRIEVAL_CANDIDATES)
+    bm25 = get_bm25_index()
+    lexical = bm25.search(query, RETRIEVAL_CANDIDATES)
+
+    docs = {doc.id: doc for doc in dense}
+    for i, _ in lexical:
+        docs.setdefault(bm25.ids[i], Document(id=bm25.ids[i], page_content=bm25.texts[i], metadata=bm25.metadatas[i] or {}))
+
+    ranked = reciprocal_rank_fusion(
+        [[doc.id for doc in dense], [bm25.ids[i] for i, _ in lexical]],
+        k=RRF_K,
+    )
+    return [docs[doc_id] for doc_id in ranked[:k]]
+
+
+def build_index():
+    # Ingestion is incremental, so this is also how the index gets updated
+    from app.vector.ingest import ingest
+
+    ingest()
+    return get_vectorstore()
+
+
+def ensure_vectorstore():
+    """Open the index, building it first if it doesn't exist yet. For warmup and deploy scripts."""
+    if not CHROMA_DIR.exists():
+        build_index()
+    return get_vectorstore()
+
+
+if __name__ == "__main__":
+    build_index()
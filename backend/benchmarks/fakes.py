@@ -0,0 +1,629 @@
+"""
+Local stand-ins for the benchmark harness: a scripted chat model, an in-memory Mongo,
+an offline tokenizer, a pass-through guardrail pipeline and an HTTP server for api_agent to call.
+
+They are installed into the app's lazily initialized singletons (see install()), so the
+code under test runs unchanged; only the network and model latency become configurable.
+"""
+import re
+import json
+import time
+import asyncio
+import threading
+from copy import deepcopy
+from datetime import datetime
+from types import SimpleNamespace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from bson import ObjectId
+from pymongo import DeleteMany, DeleteOne, InsertOne, ReplaceOne, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+
+# ---------- Chat model ----------
+
+class ScriptedChatModel:
+    """
+    Stands in for app.core.llm.LLMClient. The first step of every agent run asks api_agent
+    for the post named in the question; once an observation is in the prompt it answers.
+    Latency is a fixed time to first token plus a steady token rate.
+    """
+
+    def __init__(self, api_url: str, first_token_ms: float, tokens_per_sec: float):
+        self.api_url = api_url
+        self.first_token = first_token_ms / 1000
+        self.token_interval = 1 / tokens_per_sec if tokens_per_sec else 0.0
+
+    def _reply(self, prompt) -> str:
+        if isinstance(prompt, str):
+            # Summary refresh
+            return "The user asked about several posts and got their details."
+        last = prompt[-1].content
+        match = re.search(r"post (\d+)", prompt[1].content)
+        post_id = match.group(1) if match else "1"
+        if last.startswith("Observation"):
+            return (
+                "Thought: I have the post data.\n"
+                f"Final Answer: Post {post_id} is titled as shown in the API response, "
+                "and its body describes the topic the user asked about in a few sentences."
+            )
+        return (
+            "Thought: I need to fetch the post from the API.\n"
+            "Action: api_agent\n"
+            f'Action Input: {{"endpoint": "{self.api_url}/posts/{post_id}"}}'
+        )
+
+    @staticmethod
+    def _usage(prompt, reply: str) -> dict:
+        prompt_chars = len(prompt) if isinstance(prompt, str) else sum(len(m.content) for m in prompt)
+        # ~4 characters per token is close enough for load numbers
+        usage = {"input_tokens": prompt_chars // 4, "output_tokens": len(reply) // 4}
+        usage["total_tokens"] = usage["input_tokens"] + usage["output_tokens"]
+        return usage
+
+    @staticmethod
+    def _tokens(reply: str) -> list[str]:
+        return re.findall(r"\S+\s*|\s+", reply)
+
+    async def astream(self, prompt):
+        reply = self._reply(prompt)
+        await asyncio.sleep(self.first_token)
+        for token in self._tokens(reply):
+            yield AIMessageChunk(content=token)
+            await asyncio.sleep(self.token_interval)
+        yield AIMessageChunk(content="", usage_metadata=self._usage(prompt, reply))
+
+    async def ainvoke(self, prompt):
+        reply = self._reply(prompt)
+        await asyncio.sleep(self.first_token + self.token_interval * len(self._tokens(reply)))
+        return AIMessage(content=reply, usage_metadata=self._usage(prompt, reply))
+
+    def invoke(self, prompt):
+        reply = self._reply(prompt)
+        time.sleep(self.first_token + self.token_interval * len(self._tokens(reply)))
+        return AIMessage(content=reply, usage_metadata=self._usage(prompt, reply))
+
+
+# ---------- Mongo ----------
+
+def _get(doc: dict, path: str):
+    """(found, value) for a dotted path."""
+    value = doc
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return False, None
+        value = value[part]
+    return True, value
+
+
+def _set(doc: dict, path: str, value):
+    *parents, last = path.split(".")
+    for part in parents:
+        doc = doc.setdefault(part, {})
+    doc[last] = value
+
+
+def _unset(doc: dict, path: str):
+    *parents, last = path.split(".")
+    for part in parents:
+        doc = doc.get(part)
+        if not isinstance(doc, dict):
+            return
+    doc.pop(last, None)
+
+
+def _compare(op: str, found: bool, value, arg) -> bool:
+    value = value if found else None
+    if op == "$exists":
+        return found == bool(arg)
+    if op == "$in":
+        return value in arg
+    if op == "$nin":
+        return value not in arg
+    if op == "$ne":
+        return value != arg
+    if op == "$eq":
+        return value == arg
+    if value is None:
+        return False
+    return {
+        "$gt": lambda: value > arg,
+        "$gte": lambda: value >= arg,
+        "$lt": lambda: value < arg,
+        "$lte": lambda: value <= arg,
+    }[op]()
+
+
+def _is_operator_dict(cond) -> bool:
+    return isinstance(cond, dict) and bool(cond) and all(k.startswith("$") for k in cond)
+
+
+def _matches(doc: dict, filter: dict | None) -> bool:
+    for key, cond in (filter or {}).items():
+        if key == "$or":
+            if not any(_matches(doc, f) for f in cond):
+                return False
+        elif key == "$and":
+            if not all(_matches(doc, f) for f in cond):
+                return False
+        else:
+            found, value = _get(doc, key)
+            if _is_operator_dict(cond):
+                if not all(_compare(op, found, value, arg) for op, arg in cond.items()):
+                    return False
+            elif (value if found else None) != cond:
+                return False
+    return True
+
+
+def _each(value) -> list:
+    return list(value["$each"]) if isinstance(value, dict) and "$each" in value else [value]
+
+
+def _array(doc: dict, path: str) -> list:
+    found, current = _get(doc, path)
+    if not found or current is None:
+        current = []
+        _set(doc, path, current)
+    return current
+
+
+def _apply_update(doc: dict, update: dict, inserting: bool):
+    """Mongo's field update operators, applied in place."""
+    for op, fields in update.items():
+        for path, value in fields.items():
+            if op == "$set" or (op == "$setOnInsert" and inserting):
+                _set(doc, path, deepcopy(value))
+            elif op == "$setOnInsert":
+                continue
+            elif op == "$unset":
+                _unset(doc, path)
+            elif op == "$inc":
+                _set(doc, path, (_get(doc, path)[1] or 0) + value)
+            elif op == "$mul":
+                _set(doc, path, (_get(doc, path)[1] or 0) * value)
+            elif op in ("$max", "$min"):
+                found, current = _get(doc, path)
+                if not found or current is None or (value > current if op == "$max" else value < current):
+                    _set(doc, path, deepcopy(value))
+            elif op == "$currentDate":
+                _set(doc, path, datetime.utcnow())
+            elif op == "$rename":
+                found, current = _get(doc, path)
+                if found:
+                    _unset(doc, path)
+                    _set(doc, value, current)
+            elif op == "$addToSet":
+                array = _array(doc, path)
+                for v in _each(value):
+                    if v not in array:
+                        array.append(deepcopy(v))
+            elif op == "$push":
+                _array(doc, path).extend(deepcopy(v) for v in _each(value))
+            elif op == "$pull":
+                array = _array(doc, path)
+                array[:] = [
+                    v for v in array
+                    if not (_matches(v, value) if isinstance(value, dict) and isinstance(v, dict) else v == value)
+                ]
+            else:
+                raise NotImplementedError(f"update operator {op}")
+
+
+def _project(doc: dict, projection) -> dict:
+    if not projection:
+        return deepcopy(doc)
+    if isinstance(projection, list):
+        projection = {key: 1 for key in projection}
+    included = [k for k, v in projection.items() if v and k != "_id"]
+    if included:
+        out = {}
+        for path in included:
+            found, value = _get(doc, path)
+            if found:
+                _set(out, path, deepcopy(value))
+        if projection.get("_id", 1) and "_id" in doc:
+            out["_id"] = doc["_id"]
+        return out
+    out = deepcopy(doc)
+    for path, keep in projection.items():
+        if not keep:
+            _unset(out, path)
+    return out
+
+
+def _sort_key(doc: dict, path: str):
+    found, value = _get(doc, path)
+    # Missing and null sort first, as in Mongo
+    return (0, 0) if not found or value is None else (1, value)
+
+
+class Cursor:
+    def __init__(self, collection: "Collection", filter, projection):
+        self.collection = collection
+        self.filter = filter
+        self.projection = projection
+        self._sort = []
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key, direction=1):
+        self._sort += key if isinstance(key, list) else [(key, direction)]
+        return self
+
+    def skip(self, count: int):
+        self._skip = count
+        return self
+
+    def limit(self, count: int):
+        self._limit = count
+        return self
+
+    def batch_size(self, size: int):
+        return self
+
+    def _results(self) -> list[dict]:
+        with self.collection.lock:
+            docs = self.collection._find_docs(self.filter, self._sort)[self._skip:]
+            if self._limit:
+                docs = docs[:self._limit]
+            return [_project(d, self.projection) for d in docs]
+
+    def __iter__(self):
+        return iter(self._results())
+
+    # Motor's cursor API
+    async def to_list(self, length=None):
+        results = self._results()
+        return results if length is None else results[:length]
+
+    async def __aiter__(self):
+        for doc in self._results():
+            yield doc
+
+
+class Collection:
+    """The subset of pymongo's Collection the app uses, over a list of dicts."""
+
+    def __init__(self, lock):
+        self.docs = []
+        self.lock = lock
+        self.unique = {}  # fields of a unique index -> {key: document}
+        self.partial = {}  # fields of a unique index -> partialFilterExpression, if it has one
+
+    @staticmethod
+    def _key(doc: dict, fields: tuple) -> tuple:
+        values = (_get(doc, f)[1] for f in fields)
+        return tuple(repr(v) if isinstance(v, (dict, list)) else v for v in values)
+
+    def _indexes(self, doc: dict):
+        """The unique indexes doc belongs in (a partial index only covers matching documents)."""
+        return [(fields, index) for fields, index in self.unique.items() if _matches(doc, self.partial.get(fields) or {})]
+
+    def _claim(self, doc: dict):
+        """Register doc in the unique indexes, or raise DuplicateKeyError if another document holds its key."""
+        indexes = self._indexes(doc)
+        for fields, index in indexes:
+            owner = index.get(self._key(doc, fields))
+            if owner is not None and owner is not doc:
+                raise DuplicateKeyError(f"E11000 duplicate key error: {dict(zip(fields, self._key(doc, fields)))}", 11000)
+        for fields, index in indexes:
+            index[self._key(doc, fields)] = doc
+
+    def _release(self, doc: dict):
+        # Every index, since doc may have stopped matching a partial filter
+        for fields, index in self.unique.items():
+            key = self._key(doc, fields)
+            if index.get(key) is doc:
+                del index[key]
+
+    def _modify(self, doc: dict, change):
+        """Apply change(doc) in place, undoing it if it breaks a unique index. Callers hold the lock."""
+        before = deepcopy(doc)
+        self._release(doc)
+        change(doc)
+        try:
+            self._claim(doc)
+        except DuplicateKeyError:
+            doc.clear()
+            doc.update(before)
+            self._claim(doc)
+            raise
+
+    def _find_docs(self, filter, sort=None) -> list[dict]:
+        """Matching documents themselves (not copies), sorted. Callers hold the lock."""
+        docs = [d for d in self.docs if _matches(d, filter)]
+        for key, direction in reversed(sort or []):
+            docs.sort(key=lambda d: _sort_key(d, key), reverse=direction < 0)
+        return docs
+
+    def find(self, filter=None, projection=None, sort=None, skip=0, limit=0):
+        cursor = Cursor(self, filter, projection).skip(skip).limit(limit)
+        return cursor.sort(sort) if sort else cursor
+
+    def find_one(self, filter=None, projection=None, sort=None):
+        results = self.find(filter, projection, sort=sort, limit=1)._results()
+        return results[0] if results else None
+
+    def count_documents(self, filter=None):
+        with self.lock:
+            return sum(1 for d in self.docs if _matches(d, filter))
+
+    def insert_one(self, document: dict):
+        with self.lock:
+            document.setdefault("_id", ObjectId())
+            doc = deepcopy(document)
+            self._claim(doc)
+            self.docs.append(doc)
+        return SimpleNamespace(inserted_id=document["_id"])
+
+    def insert_many(self, documents: list[dict], ordered=True):
+        result = self.bulk_write([InsertOne(d) for d in documents], ordered=ordered)
+        return SimpleNamespace(inserted_ids=[d["_id"] for d in documents][:result.inserted_count])
+
+    def _upsert(self, filter: dict, update: dict) -> dict:
+        doc = {"_id": ObjectId()}
+        for key, cond in filter.items():
+            if not key.startswith("$") and not _is_operator_dict(cond):
+                _set(doc, key, deepcopy(cond))
+        _apply_update(doc, update, inserting=True)
+        self._claim(doc)
+        self.docs.append(doc)
+        return doc
+
+    def _update(self, filter, update, upsert: bool, many: bool):
+        with self.lock:
+            matched = self._find_docs(filter)
+            if not many:
+                matched = matched[:1]
+            if not matched and upsert:
+                doc = self._upsert(filter, update)
+                return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=doc["_id"])
+            for doc in matched:
+                self._modify(doc, lambda d: _apply_update(d, update, inserting=False))
+            return SimpleNamespace(matched_count=len(matched), modified_count=len(matched), upserted_id=None)
+
+    def update_one(self, filter, update, upsert=False):
+        return self._update(filter, update, upsert, many=False)
+
+    def update_many(self, filter, update, upsert=False):
+        return self._update(filter, update, upsert, many=True)
+
+    def find_one_and_update(self, filter, update, projection=None, upsert=False, return_document=False, sort=None):
+        with self.lock:
+            docs = self._find_docs(filter, sort)
+            if not docs:
+                if not upsert:
+                    return None
+                doc = self._upsert(filter, update)
+                return _project(doc, projection) if return_document else None
+            doc = docs[0]
+            before = _project(doc, projection)
+            self._modify(doc, lambda d: _apply_update(d, update, inserting=False))
+            # pymongo's ReturnDocument.AFTER is True, BEFORE is False
+            return _project(doc, projection) if return_document else before
+
+    def _delete(self, filter, many: bool):
+        with self.lock:
+            matched = self._find_docs(filter)
+            if not many:
+                matched = matched[:1]
+            for doc in matched:
+                self._release(doc)
+            ids = {id(d) for d in matched}
+            self.docs = [d for d in self.docs if id(d) not in ids]
+            return SimpleNamespace(deleted_count=len(matched))
+
+    def delete_one(self, filter):
+        return self._delete(filter, many=False)
+
+    def delete_many(self, filter):
+        return self._delete(filter, many=True)
+
+    def bulk_write(self, requests: list, ordered=True):
+        """pymongo's InsertOne/UpdateOne/UpdateMany/DeleteOne/DeleteMany/ReplaceOne, with its error reporting."""
+        counts = {"inserted_count": 0, "matched_count": 0, "modified_count": 0, "deleted_count": 0, "upserted_count": 0}
+        errors = []
+        for index, request in enumerate(requests):
+            try:
+                counts_for = self._bulk_one(request)
+            except DuplicateKeyError as e:
+                errors.append({"index": index, "code": 11000, "errmsg": str(e), "op": request})
+                if ordered:
+                    break
+                continue
+            for key, value in counts_for.items():
+                counts[key] += value
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": counts["inserted_count"]})
+        return SimpleNamespace(**counts)
+
+    def _bulk_one(self, request) -> dict:
+        doc = getattr(request, "_doc", None)
+        filter = getattr(request, "_filter", None)
+        upsert = bool(getattr(request, "_upsert", False))
+        if isinstance(request, InsertOne):
+            self.insert_one(doc)
+            return {"inserted_count": 1}
+        if isinstance(request, (UpdateOne, UpdateMany)):
+            result = self._update(filter, doc, upsert, many=isinstance(request, UpdateMany))
+        elif isinstance(request, ReplaceOne):
+            result = self._replace(filter, doc, upsert)
+        elif isinstance(request, (DeleteOne, DeleteMany)):
+            return {"deleted_count": self._delete(filter, many=isinstance(request, DeleteMany)).deleted_count}
+        else:
+            raise NotImplementedError(f"bulk operation {type(request).__name__}")
+        return {
+            "matched_count": result.matched_count,
+            "modified_count": result.modified_count,
+            "upserted_count": int(result.upserted_id is not None),
+        }
+
+    def _replace(self, filter, replacement: dict, upsert: bool):
+        with self.lock:
+            matched = self._find_docs(filter)[:1]
+            if not matched:
+                if not upsert:
+                    return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=None)
+                doc = {"_id": ObjectId(), **deepcopy(replacement)}
+                self._claim(doc)
+                self.docs.append(doc)
+                return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=doc["_id"])
+
+            def replace(doc):
+                _id = doc["_id"]
+                doc.clear()
+                doc.update({"_id": _id, **deepcopy(replacement)})
+
+            self._modify(matched[0], replace)
+            return SimpleNamespace(matched_count=1, modified_count=1, upserted_id=None)
+
+    def replace_one(self, filter, replacement, upsert=False):
+        return self._replace(filter, replacement, upsert)
+
+    def create_index(self, keys, unique=False, partialFilterExpression=None, **kwargs):
+        # Lookups always scan; only uniqueness is modelled, since the app relies on it
+        keys = [(keys, 1)] if isinstance(keys, str) else list(keys)
+        if unique:
+            fields = tuple(k for k, _ in keys)
+            with self.lock:
+                if fields not in self.unique:
+                    self.partial[fields] = partialFilterExpression
+                    self.unique[fields] = {
+                        self._key(d, fields): d for d in self.docs if _matches(d, partialFilterExpression or {})
+                    }
+        return "_".join(f"{k}_{d}" for k, d in keys)
+
+
+class AsyncCollection:
+    """Motor-style view of the same Collection: awaitable methods, cursors returned directly."""
+
+    def __init__(self, collection: Collection):
+        self.collection = collection
+
+    def find(self, *args, **kwargs):
+        return self.collection.find(*args, **kwargs)
+
+    def __getattr__(self, name):
+        method = getattr(self.collection, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+        return call
+
+
+class FakeDatabase:
+    def __init__(self, collections: dict, lock, is_async: bool):
+        self.collections = collections
+        self.lock = lock
+        self.is_async = is_async
+
+    def __getitem__(self, name: str):
+        collection = self.collections.setdefault(name, Collection(self.lock))
+        return AsyncCollection(collection) if self.is_async else collection
+
+
+class FakeMongoClient:
+    """Shared in-memory storage; the sync and async clients see the same data."""
+
+    def __init__(self, databases: dict | None = None, lock=None, is_async: bool = False):
+        self.databases = {} if databases is None else databases
+        self.lock = lock or threading.RLock()
+        self.is_async = is_async
+
+    def __getitem__(self, name: str) -> FakeDatabase:
+        return FakeDatabase(self.databases.setdefault(name, {}), self.lock, self.is_async)
+
+    def async_view(self) -> "FakeMongoClient":
+        return FakeMongoClient(self.databases, self.lock, is_async=True)
+
+    def close(self):
+        pass
+
+
+# ---------- Tokenizer ----------
+
+class WordEncoding:
+    """
+    Stands in for the tiktoken encoding, which is downloaded on first use. One token per
+    word, punctuation mark or whitespace run: close enough for budgets, and offline.
+    """
+
+    TOKEN_RE = re.compile(r"\w+|[^\w\s]|\s+")
+
+    def encode(self, text: str, disallowed_special=()) -> list[str]:
+        return self.TOKEN_RE.findall(text)
+
+    def decode(self, tokens: list[str]) -> str:
+        return "".join(tokens)
+
+
+# ---------- Guardrails ----------
+
+def neutral_pipeline(texts, batch_size=None):
+    """Drop-in for the toxicity classifier that scores everything as safe, instantly."""
+    return [[{"label": "neutral", "score": 1.0}] for _ in texts]
+
+
+# ---------- HTTP API for api_agent ----------
+
+class FakeAPIServer:
+    """Serves /posts/<id> (and anything else) as JSON on localhost with a fixed delay."""
+
+    def __init__(self, latency_ms: float, body_bytes: int):
+        latency = latency_ms / 1000
+        body = "lorem ipsum " * (body_bytes // 12)
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                time.sleep(latency)
+                match = re.search(r"/(\d+)", self.path)
+                payload = json.dumps({
+                    "id": int(match.group(1)) if match else 1,
+                    "title": f"Post at {self.path}",
+                    "body": body,
+                }).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, name="fake-api", daemon=True)
+
+    def start(self) -> "FakeAPIServer":
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+
+# ---------- Wiring ----------
+
+def install(api_url: str, first_token_ms: float, tokens_per_sec: float, real_guardrails: bool = False) -> FakeMongoClient:
+    """Point the app's singletons at the stand-ins. Returns the Mongo client for seeding."""
+    from app.core import llm
+    from app.db import mongo
+    from app.helper import guardrails, token_budget
+
+    llm._llm = ScriptedChatModel(api_url, first_token_ms, tokens_per_sec)
+    token_budget._encoding = WordEncoding()
+
+    client = FakeMongoClient()
+    mongo._client = client
+    mongo._async_client = client.async_view()
+
+    if not real_guardrails:
+        guardrails._batcher = guardrails.ToxicityBatcher(
+            neutral_pipeline,
+            max_batch_size=guardrails.GUARDRAIL_MAX_BATCH_SIZE,
+            max_wait_ms=guardrails.GUARDRAIL_MAX_WAIT_MS,
+            cache_size=guardrails.GUARDRAIL_CACHE_SIZE,
+        )
+    return client
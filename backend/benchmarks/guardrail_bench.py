@@ -0,0 +1,81 @@
+"""
+Throughput of the toxicity guardrail: llm_guard's per-call scanner vs the micro-batched worker.
+
+Run from backend/:
+    python -m benchmarks.guardrail_bench --requests 128 --concurrency 16
+"""
+import argparse
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Every sentence carries the sample number: the guardrail scores (and caches) per sentence
+SAMPLE = (
+    "Can you show me the comments for post {i}? "
+    "I would like to see who wrote the {i} comments. "
+    "Please also list the albums of user {i}."
+)
+
+
+def run(check, texts, concurrency):
+    latencies = []
+
+    def timed(text):
+        start = time.perf_counter()
+        check(text)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(timed, texts))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests_per_sec": round(len(texts) / elapsed, 2),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=128)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    from llm_guard.input_scanners import Toxicity
+    from llm_guard.input_scanners.toxicity import MatchType
+    from app.helper import guardrails
+
+    # Distinct sentences so the batcher's verdict cache doesn't flatter the result
+    texts = [SAMPLE.format(i=i) for i in range(args.requests)]
+
+    per_call = Toxicity(threshold=0.5, match_type=MatchType.SENTENCE, use_onnx=guardrails.GUARDRAIL_USE_ONNX)
+    per_call.scan(texts[0])
+    guardrails.input_guardrail_check("warmup")
+    cache = guardrails.get_toxicity_batcher().cache
+    cache.clear()
+    hits = cache.hits
+
+    results = {
+        "per_call": run(per_call.scan, texts, args.concurrency),
+        "batched": run(guardrails.input_guardrail_check, texts, args.concurrency),
+    }
+    results["batched"]["cache_hits"] = cache.hits - hits
+    # The same texts again, every verdict now cached: what repeated text costs, not batching
+    results["batched_cached"] = run(guardrails.input_guardrail_check, texts, args.concurrency)
+    results["speedup"] = round(results["batched"]["requests_per_sec"] / results["per_call"]["requests_per_sec"], 2)
+    results["config"] = {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "max_batch_size": guardrails.GUARDRAIL_MAX_BATCH_SIZE,
+        "max_wait_ms": guardrails.GUARDRAIL_MAX_WAIT_MS,
+        "onnx": guardrails.GUARDRAIL_USE_ONNX,
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""
+Throughput and tail latency of the HTTP routes with no network dependencies.
+
+The app runs under uvicorn in this process with local stand-ins (benchmarks/fakes.py):
+a scripted chat model with configurable latency and token rate, an in-memory Mongo and
+a local HTTP server for api_agent. Each phase drives one route at the given concurrency.
+
+Run from backend/:
+    python -m benchmarks.load_bench --requests 200 --concurrency 16 \\
+        --max ask.p95_ms=3000 --max history.p99_ms=100 --min ask.rps=5
+
+Prints JSON with p50/p95/p99, requests/sec and error counts per route, plus the
+per-stage breakdown from /metrics for the /ask/stream phase. An /ask/stream run only
+counts as a success if its NDJSON stream ends in a final answer without an error event. Exits non-zero when any
+--max/--min threshold (route.metric=limit) is not met.
+"""
+import re
+import sys
+import json
+import time
+import math
+import socket
+import asyncio
+import logging
+import argparse
+import threading
+import contextlib
+from collections import Counter, defaultdict
+import httpx
+import uvicorn
+from benchmarks import fakes
+
+STAGE_RE = re.compile(r'^(agent_stage_seconds|agent_tool_seconds)_(sum|count)\{(?:stage|tool)="([^"]+)"\} (\S+)$')
+STEPS_RE = re.compile(r"^agent_steps_(sum|count) (\S+)$")
+
+
+def percentile(samples: list[float], p: float) -> float:
+    """Nearest-rank percentile of sorted samples."""
+    return samples[max(0, math.ceil(len(samples) * p / 100) - 1)]
+
+
+def summarize(latencies: list[float], ttfb: list[float], statuses: Counter, elapsed: float) -> dict:
+    latencies.sort()
+    ttfb.sort()
+    report = {
+        "requests": sum(statuses.values()),
+        "errors": sum(n for status, n in statuses.items() if status != 200),
+        "status_counts": {str(k): v for k, v in sorted(statuses.items(), key=lambda item: str(item[0]))},
+        "rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+    }
+    for p in (50, 95, 99):
+        report[f"p{p}_ms"] = round(percentile(latencies, p) * 1000, 1) if latencies else None
+    if ttfb:
+        report["ttfb_p50_ms"] = round(percentile(ttfb, 50) * 1000, 1)
+        report["ttfb_p95_ms"] = round(percentile(ttfb, 95) * 1000, 1)
+    return report
+
+
+async def drive(send, total: int, concurrency: int) -> dict:
+    """Run send(i) for i in range(total) with at most concurrency in flight."""
+    latencies, ttfb, statuses = [], [], Counter()
+    indices = iter(range(total))
+
+    async def worker():
+        for i in indices:
+            start = time.perf_counter()
+            try:
+                status, first_byte = await send(i)
+            except Exception as e:
+                statuses[type(e).__name__] += 1
+                continue
+            statuses[status] += 1
+            if status == 200:
+                latencies.append(time.perf_counter() - start)
+                if first_byte is not None:
+                    ttfb.append(first_byte - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, ttfb, statuses, time.perf_counter() - start)
+
+
+def parse_stage_metrics(text: str) -> dict:
+    totals = defaultdict(float)
+    for line in text.splitlines():
+        if match := STAGE_RE.match(line):
+            metric, field, name, value = match.groups()
+            prefix = "tool" if metric == "agent_tool_seconds" else "stage"
+            totals[(prefix, name, field)] += float(value)
+        elif match := STEPS_RE.match(line):
+            totals[("steps", "", match.group(1))] += float(match.group(2))
+    return totals
+
+
+def stage_breakdown(before: dict, after: dict) -> dict:
+    delta = {key: after[key] - before.get(key, 0.0) for key in after}
+    breakdown = {"stages": {}, "tools": {}}
+    for (prefix, name, field), count in delta.items():
+        if field != "count" or not count or prefix == "steps":
+            continue
+        total = delta[(prefix, name, "sum")]
+        breakdown["stages" if prefix == "stage" else "tools"][name] = {
+            "count": int(count),
+            "mean_ms": round(total / count * 1000, 2),
+            "total_s": round(total, 3),
+        }
+    steps = delta.get(("steps", "", "count"))
+    if steps:
+        breakdown["steps_per_request"] = round(delta[("steps", "", "sum")] / steps, 2)
+    return breakdown
+
+
+def check_thresholds(results: dict, maxima: list[str], minima: list[str]) -> list[dict]:
+    checks = []
+    for limits, compare, kind in ((maxima, lambda v, l: v <= l, "max"), (minima, lambda v, l: v >= l, "min")):
+        for spec in limits:
+            name, limit = spec.split("=", 1)
+            route, metric = name.split(".", 1)
+            value = results.get(route, {}).get(metric)
+            checks.append({
+                "check": f"{name} {'<=' if kind == 'max' else '>='} {limit}",
+                "value": value,
+                "passed": value is not None and compare(value, float(limit)),
+            })
+    return checks
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def seed(client: fakes.FakeMongoClient, sessions: int, messages: int) -> list[str]:
+    from app.db.db import MongoDBMemory
+
+    session_ids = []
+    for i in range(sessions):
+        session_id = f"seed-{i}"
+        memory = MongoDBMemory(session_id, f"seed-user-{i % 20}")
+        memory.append_messages([
+            ("user" if j % 2 == 0 else "assistant", f"Seeded message {j} about post {j % 100}")
+            for j in range(messages)
+        ])
+        session_ids.append(session_id)
+    return session_ids
+
+
+async def run_phases(base_url: str, args, seeded: list[str]) -> dict:
+    results = {}
+    timeout = httpx.Timeout(120.0)
+    limits = httpx.Limits(max_connections=args.concurrency * 2)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        before = parse_stage_metrics((await client.get("/metrics")).text)
+
+        async def ask(i):
+            body = {
+                "user_input": f"Show me the details of post {i % 100 + 1}",
+                "session_id": f"bench-{i % args.sessions}",
+                "user_id": f"bench-user-{i % args.users}",
+            }
+            # NDJSON, because the agent's errors arrive inside a 200 body: an error event, or no final answer
+            first_byte = None
+            outcome = None
+            async with client.stream("POST", "/ask/stream", params={"format": "ndjson"}, json=body) as response:
+                if response.status_code != 200:
+                    return response.status_code, None
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    event = json.loads(line)
+                    if event["type"] in ("token", "final") and first_byte is None:
+                        first_byte = time.perf_counter()
+                    if event["type"] == "error":
+                        outcome = f"stream_error_{event.get('status')}"
+                    elif event["type"] == "final" and outcome is None:
+                        outcome = 200
+            return outcome or "no_final_answer", first_byte
+
+        async def sessions(i):
+            response = await client.get("/sessions")
+            return response.status_code, None
+
+        async def history(i):
+            response = await client.get(f"/history/{seeded[i % len(seeded)]}")
+            return response.status_code, None
+
+        if "ask" in args.phases:
+            results["ask"] = await drive(ask, args.requests, args.concurrency)
+            # Let background summary refreshes settle before reading the counters
+            await asyncio.sleep(0.5)
+            after = parse_stage_metrics((await client.get("/metrics")).text)
+            results["ask"]["breakdown"] = stage_breakdown(before, after)
+        if "sessions" in args.phases:
+            results["sessions"] = await drive(sessions, args.requests, args.concurrency)
+        if "history" in args.phases and seeded:
+            results["history"] = await drive(history, args.requests, args.concurrency)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="requests per phase")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--phases", default="ask,sessions,history")
+    parser.add_argument("--sessions", type=int, default=50, help="sessions the /ask/stream phase writes to")
+    parser.add_argument("--users", type=int, default=None, help="distinct user ids (default: concurrency)")
+    parser.add_argument("--seed-sessions", type=int, default=200, help="sessions created before the run")
+    parser.add_argument("--seed-messages", type=int, default=20, help="messages per seeded session")
+    parser.add_argument("--llm-first-token-ms", type=float, default=300)
+    parser.add_argument("--llm-tokens-per-sec", type=float, default=50)
+    parser.add_argument("--api-latency-ms", type=float, default=50)
+    parser.add_argument("--api-body-bytes", type=int, default=2000)
+    parser.add_argument("--real-guardrails", action="store_true", help="load the toxicity model instead of a pass-through")
+    parser.add_argument("--max", action="append", default=[], metavar="ROUTE.METRIC=LIMIT")
+    parser.add_argument("--min", action="append", default=[], metavar="ROUTE.METRIC=LIMIT")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+    args.users = args.users or args.concurrency
+    args.phases = set(args.phases.split(","))
+
+    logging.getLogger().setLevel(args.log_level)
+    api = fakes.FakeAPIServer(args.api_latency_ms, args.api_body_bytes).start()
+    mongo_client = fakes.install(api.url, args.llm_first_token_ms, args.llm_tokens_per_sec, args.real_guardrails)
+    seeded = seed(mongo_client, args.seed_sessions, args.seed_messages)
+
+    from app.main import app
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, name="uvicorn", daemon=True)
+
+    # Keep stdout for the report alone
+    with contextlib.redirect_stdout(sys.stderr):
+        thread.start()
+        while not server.started:
+            time.sleep(0.05)
+        try:
+            results = asyncio.run(run_phases(f"http://127.0.0.1:{port}", args, seeded))
+        finally:
+            server.should_exit = True
+            thread.join()
+            api.stop()
+
+    checks = check_thresholds(results, args.max, args.min)
+    report = {
+        "config": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "llm_first_token_ms": args.llm_first_token_ms,
+            "llm_tokens_per_sec": args.llm_tokens_per_sec,
+            "api_latency_ms": args.api_latency_ms,
+            "seed_sessions": args.seed_sessions,
+            "seed_messages": args.seed_messages,
+        },
+        "results": results,
+        "thresholds": checks,
+        "passed": all(c["passed"] for c in checks),
+    }
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if report["passed"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Cold-start cost of importing the FastAPI app, measured with `python -X importtime`.
+
+Run from backend/:
+    python -m benchmarks.startup_bench --runs 5 --max-ms 1500
+
+Each run is a fresh interpreter. Prints JSON with the median total import time
+and the slowest modules, and exits non-zero when the median exceeds --max-ms.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def import_times(module: str) -> dict[str, int]:
+    """Cumulative import time in microseconds per module, for one cold interpreter."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+
+    times = {}
+    for line in proc.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line.split(":", 1)[1].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--max-ms", type=float, default=None, help="fail if the median import time exceeds this")
+    args = parser.parse_args()
+
+    runs = [import_times(args.module) for _ in range(args.runs)]
+    totals = [r[args.module] / 1000 for r in runs]
+    median_ms = statistics.median(totals)
+
+    # Top-level packages only, so nested imports aren't counted twice
+    last = runs[-1]
+    slowest = sorted(
+        ((name, us) for name, us in last.items() if "." not in name and name != args.module),
+        key=lambda item: item[1],
+        reverse=True,
+    )[: args.top]
+
+    report = {
+        "module": args.module,
+        "runs": args.runs,
+        "median_ms": round(median_ms, 1),
+        "min_ms": round(min(totals), 1),
+        "max_ms": round(max(totals), 1),
+        "slowest_packages_ms": {name: round(us / 1000, 1) for name, us in slowest},
+        "threshold_ms": args.max_ms,
+        "passed": args.max_ms is None or median_ms <= args.max_ms,
+    }
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if report["passed"] else 1)
+
+
+if __name__ == "__main__":
+    main()
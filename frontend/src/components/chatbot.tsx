@@ -1,4 +1,4 @@
-import React, { useEffect, useRef, useState } from "react";
+import React, { useEffect, useLayoutEffect, useRef, useState } from "react";
 import { Send, RotateCcw, MessageSquare, Plus, Trash2, Menu } from "lucide-react";
 
 interface Message {
@@ -13,6 +13,12 @@ interface Session {
   last_updated?: string;
 }
 
+const toMessages = (history: any[]): Message[] =>
+  history.map((m: any) => ({
+    role: m.type === "human" ? "user" : "assistant",
+    content: m.content
+  }));
+
 const ChatLoader = () => (
   <div className="flex gap-1">
     <div className="w-2 h-2 bg-gray-400 rounded-full animate-bounce" style={{ animationDelay: "0ms" }} />
@@ -26,10 +32,18 @@ const Chatbot: React.FC = () => {
   const [input, setInput] = useState("");
   const [isLoading, setIsLoading] = useState(false);
   const [sessions, setSessions] = useState<Session[]>([]);
+  const [sessionsCursor, setSessionsCursor] = useState<string | null>(null);
   const [sessionId, setSessionId] = useState<string>("");
   const [userId, setUserId] = useState<string>("vishnu"); // Default user as per screenshot
   const [isSidebarOpen, setIsSidebarOpen] = useState(true);
+  // /history returns the latest page; next_before pages further back as the user scrolls up
+  const [historyBefore, setHistoryBefore] = useState<number | null>(null);
+  const [isLoadingOlder, setIsLoadingOlder] = useState(false);
   const messagesEndRef = useRef<HTMLDivElement>(null);
+  const messagesContainerRef = useRef<HTMLDivElement>(null);
+  const historySessionRef = useRef<string>("");
+  // scrollHeight before older messages were prepended, so the view can stay where it was
+  const prependedFromHeightRef = useRef<number | null>(null);
 
   useEffect(() => {
     const storedSessionId = localStorage.getItem("chat_session_id");
@@ -47,7 +61,13 @@ const Chatbot: React.FC = () => {
     fetchSessions();
   }, []);
 
-  useEffect(() => {
+  useLayoutEffect(() => {
+    const container = messagesContainerRef.current;
+    if (prependedFromHeightRef.current !== null && container) {
+      container.scrollTop += container.scrollHeight - prependedFromHeightRef.current;
+      prependedFromHeightRef.current = null;
+      return;
+    }
     messagesEndRef.current?.scrollIntoView({ behavior: "smooth" });
   }, [messages]);
 
@@ -56,30 +76,68 @@ const Chatbot: React.FC = () => {
       const res = await fetch("http://127.0.0.1:8000/sessions");
       const data = await res.json();
       setSessions(data.sessions || []);
+      setSessionsCursor(data.next_cursor || null);
     } catch (error) {
       console.error("Failed to fetch sessions", error);
     }
   };
 
+  const loadMoreSessions = async () => {
+    if (!sessionsCursor) return;
+    try {
+      const res = await fetch(`http://127.0.0.1:8000/sessions?cursor=${encodeURIComponent(sessionsCursor)}`);
+      const data = await res.json();
+      setSessions(prev => {
+        const seen = new Set(prev.map(s => s.id));
+        return [...prev, ...(data.sessions || []).filter((s: Session) => !seen.has(s.id))];
+      });
+      setSessionsCursor(data.next_cursor || null);
+    } catch (error) {
+      console.error("Failed to load more sessions", error);
+    }
+  };
+
   const fetchHistory = async (sid: string) => {
+    historySessionRef.current = sid;
+    setHistoryBefore(null);
     try {
       const res = await fetch(`http://127.0.0.1:8000/history/${sid}`);
       const data = await res.json();
-      if (data.history) {
-        setMessages(data.history.map((m: any) => ({
-          role: m.type === "human" ? "user" : "assistant",
-          content: m.content
-        })));
+      if (data.history && historySessionRef.current === sid) {
+        setMessages(toMessages(data.history));
+        setHistoryBefore(data.next_before ?? null);
       }
     } catch (error) {
       console.error("Failed to fetch history", error);
     }
   };
 
+  const loadOlderMessages = async () => {
+    // Not while streaming: the answer is written to a fixed index in messages
+    if (historyBefore === null || isLoadingOlder || isLoading) return;
+    const sid = historySessionRef.current;
+    setIsLoadingOlder(true);
+    try {
+      const res = await fetch(`http://127.0.0.1:8000/history/${sid}?before=${historyBefore}`);
+      const data = await res.json();
+      if (data.history && historySessionRef.current === sid) {
+        prependedFromHeightRef.current = messagesContainerRef.current?.scrollHeight ?? null;
+        setMessages(prev => [...toMessages(data.history), ...prev]);
+        setHistoryBefore(data.next_before ?? null);
+      }
+    } catch (error) {
+      console.error("Failed to load older messages", error);
+    } finally {
+      setIsLoadingOlder(false);
+    }
+  };
+
   const handleNewChat = () => {
     const newId = crypto.randomUUID();
     setSessionId(newId);
     localStorage.setItem("chat_session_id", newId);
+    historySessionRef.current = newId;
+    setHistoryBefore(null);
     setMessages([]);
     fetchSessions();
   };
@@ -242,6 +300,14 @@ const Chatbot: React.FC = () => {
               </div>
             </div>
           ))}
+          {sessionsCursor && (
+            <button
+              onClick={loadMoreSessions}
+              className="w-full px-3 py-2 mb-2 rounded-lg text-xs font-medium text-gray-400 hover:bg-gray-800 hover:text-white transition-colors"
+            >
+              Load more
+            </button>
+          )}
         </div>
       </div>
 
@@ -281,8 +347,25 @@ const Chatbot: React.FC = () => {
         </div>
 
         {/* Messages */}
-        <div className="flex-1 overflow-y-auto p-4 md:p-8">
+        <div
+          ref={messagesContainerRef}
+          onScroll={e => {
+            if (e.currentTarget.scrollTop < 80) loadOlderMessages();
+          }}
+          className="flex-1 overflow-y-auto p-4 md:p-8"
+        >
           <div className="max-w-3xl mx-auto space-y-8">
+            {historyBefore !== null && (
+              <div className="flex justify-center">
+                <button
+                  onClick={loadOlderMessages}
+                  disabled={isLoadingOlder || isLoading}
+                  className="px-3 py-1.5 rounded-lg text-xs font-medium text-gray-500 bg-gray-100 hover:bg-gray-200 disabled:opacity-50 transition-colors"
+                >
+                  {isLoadingOlder ? "Loading..." : "Load earlier messages"}
+                </button>
+              </div>
+            )}
             {messages.length === 0 && (
               <div className="flex flex-col items-center justify-center h-full text-center py-20">
                 <div className="w-16 h-16 bg-blue-50 rounded-2xl flex items-center justify-center mb-4">